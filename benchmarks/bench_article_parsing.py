@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Compares the single pass attribute parser of ``Article`` with the sequential
+one on the sample data in ``ot/``, ``outt/`` and ``out/``.
+"""
+from argparse import ArgumentParser
+from timeit import repeat
+
+from sample_corpus import render_article, sample_articles
+
+from nexis_db.Article import Article
+
+
+def sequential_parse(text):
+    kwargs, text = Article._parse_attributes_sequentially(text)
+    kwargs['company_canonical_name'] = kwargs['company_name'] = None
+    return Article(text.strip(), **kwargs)
+
+
+def single_pass_parse(text):
+    return Article._single_article_from_text(text, None, None)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=5,
+                        help='Passes over the corpus per measurement.')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Number of measurements, the best is reported.')
+    args = parser.parse_args()
+
+    documents = [render_article(article).strip()
+                 for article in sample_articles()]
+    megabytes = sum(map(len, documents)) / 1e6
+    print('Corpus: {} documents, {:.2f} MB'.format(len(documents), megabytes))
+
+    for document in documents:
+        if (sequential_parse(document).__json__() !=
+                single_pass_parse(document).__json__()):
+            raise AssertionError('Parsers disagree on:\n' + document[:500])
+
+    for name, parse in (('sequential', sequential_parse),
+                        ('single pass', single_pass_parse)):
+        best = min(repeat(lambda: [parse(doc) for doc in documents],
+                          number=args.number, repeat=args.repeat))
+        per_pass = best / args.number
+        print('{:>12}: {:8.2f} ms/pass {:10.0f} docs/s {:8.2f} MB/s'.format(
+            name, per_pass * 1e3, len(documents) / per_pass,
+            megabytes / per_pass))
+
+
+if __name__ == '__main__':
+    main()
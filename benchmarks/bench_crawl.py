@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Crawls the fake Nexis server of ``fake_nexis.py`` with real browsers, from
+the login to the parsed articles, and reports the documents per second.
+Needs firefox and geckodriver like the crawler itself.
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+
+from fake_nexis import FakeNexisServer, build_database, query_name
+from sample_corpus import sample_articles
+
+from nexis_db.PacingPolicy import PacingPolicy
+from nexis_db.ParallelNexis import ENGINES, do_parallel_queries
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-j', '--jobs', type=int, default=2,
+                        help='Number of sessions.')
+    parser.add_argument('-q', '--queries', type=int, default=10,
+                        help='Number of queries.')
+    parser.add_argument('-c', '--copies', type=int, default=1,
+                        help='How often every sample article is repeated.')
+    parser.add_argument('-l', '--latency', type=float, default=0.05,
+                        help='Seconds the server delays every request.')
+    parser.add_argument('-e', '--error-rate', type=float, default=0.0,
+                        help='Probability of a failing download request.')
+    parser.add_argument('-p', '--parse-workers', type=int, default=0,
+                        help='Threads per session parsing downloaded '
+                             'batches.')
+    parser.add_argument('--direct-download', action='store_true',
+                        help='Fetch delivered files over HTTP instead of '
+                             'through the browser.')
+    parser.add_argument('--engine', choices=sorted(ENGINES),
+                        default='processes')
+    parser.add_argument('--show', action='store_true',
+                        help='Show the browser windows.')
+    args = parser.parse_args()
+
+    server = FakeNexisServer(
+        build_database(sample_articles(), args.queries, args.copies),
+        args.latency, args.error_rate)
+    server.start()
+    rows = [{'name': query_name(index)} for index in range(args.queries)]
+    users = {'user{}'.format(index): 'password'
+             for index in range(args.jobs)}
+
+    documents = finished = 0
+    start = perf_counter()
+    try:
+        for name, result in do_parallel_queries(
+                rows, args.jobs, users, hide=not args.show,
+                pacing=PacingPolicy(0, 0), engine=args.engine,
+                login_url=server.login_url,
+                parse_workers=args.parse_workers,
+                direct_download=args.direct_download):
+            finished += 1
+            # Too big queries come back as dict
+            if isinstance(result, list):
+                documents += len(result)
+    finally:
+        server.stop()
+    seconds = perf_counter() - start
+
+    print('{} documents of {} queries in {:.1f} s with {} sessions: '
+          '{:.1f} documents/s'.format(documents, finished, seconds, args.jobs,
+                                      documents / seconds))
+    if finished < len(rows):
+        print(len(rows) - finished, 'queries failed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Compares the cached JSONEncoder against the original one that probed every
+object from scratch, on a corpus built from the sample data in ``ot/``,
+``outt/`` and ``out/``. Both must produce identical output.
+"""
+import json
+from argparse import ArgumentParser
+from collections.abc import Iterable
+from datetime import datetime
+from timeit import repeat
+
+from sample_corpus import render_export, sample_articles
+
+from nexis_db.Article import Article
+from nexis_db.JSONEncoder import JSONEncoder, get_public_members
+
+
+class OriginalJSONEncoder(json.JSONEncoder):
+
+    def default(self, obj):
+        if hasattr(obj, "__json__"):
+            return obj.__json__()
+        elif isinstance(obj, Iterable):
+            return list(obj)
+        elif isinstance(obj, datetime):
+            return obj.isoformat()
+        elif hasattr(obj, "__getitem__") and hasattr(obj, "keys"):
+            return dict(obj)
+        elif hasattr(obj, "__dict__"):
+            return {member: getattr(obj, member)
+                    for member in get_public_members(obj)}
+
+        return json.JSONEncoder.default(self, obj)
+
+
+class Query:
+    """
+    A plain object, encoded by its public members and properties.
+    """
+
+    def __init__(self, article):
+        self.headline = '; '.join(getattr(article, 'headline', ()))
+        self.found = datetime(2017, 1, 1)
+        self._hidden = True
+
+    @property
+    def words(self):
+        return self.headline.split() if self.headline else []
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--articles', type=int, default=10000,
+                        help='Number of articles in the corpus.')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of measurements, the best is reported.')
+    args = parser.parse_args()
+
+    samples = list(sample_articles())
+    copies = -(-args.articles // len(samples))
+    articles = list(Article.from_nexis_text(
+        render_export(samples * copies), None, None))[:args.articles]
+    mixed = [Query(article) for article in articles]
+    print('Corpus: {} articles'.format(len(articles)))
+
+    for name, corpus in (('articles', articles), ('objects', mixed)):
+        for options in ({'indent': 1}, {'separators': (',', ':')}):
+            original = OriginalJSONEncoder(**options)
+            cached = JSONEncoder(**options)
+            assert [original.encode(item) for item in corpus] == \
+                [cached.encode(item) for item in corpus]
+
+            times = {}
+            for encoder_name, encoder in (('original', original),
+                                          ('cached', cached)):
+                times[encoder_name] = min(repeat(
+                    lambda: [encoder.encode(item) for item in corpus],
+                    number=1, repeat=args.repeat))
+            print('{:>8} {:>7}: original {:8.2f} ms, cached {:8.2f} ms '
+                  '({:.2f}x)'.format(
+                      name, 'indent' if 'indent' in options else 'compact',
+                      times['original'] * 1e3, times['cached'] * 1e3,
+                      times['original'] / times['cached']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Compares the output formats on the sample data in ``ot/``, ``outt/`` and
+``out/``: bytes on disk and write throughput.
+"""
+from argparse import ArgumentParser
+from os import path
+from tempfile import TemporaryDirectory
+from timeit import repeat
+
+from sample_corpus import render_export, sample_articles
+
+from nexis_db.Article import Article
+from nexis_db.OutputWriter import OUTPUT_FORMATS, write_result, zstandard
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-c', '--copies', type=int, default=5,
+                        help='How often the sample corpus is repeated.')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of measurements, the best is reported.')
+    args = parser.parse_args()
+
+    articles = list(Article.from_nexis_text(
+        render_export(list(sample_articles()) * args.copies), None, None))
+    print('Corpus: {} articles'.format(len(articles)))
+
+    with TemporaryDirectory() as directory:
+        for output_format, writer in sorted(OUTPUT_FORMATS.items()):
+            if writer.extension.endswith('.zst') and zstandard is None:
+                print('{:>10}: skipped, zstandard is not installed'.format(
+                    output_format))
+                continue
+
+            filename = path.join(directory, 'result' + writer.extension)
+            best = min(repeat(
+                lambda: write_result(filename, articles, output_format),
+                number=1, repeat=args.repeat))
+            size = path.getsize(filename)
+            print('{:>10}: {:10} bytes {:8.2f} ms {:10.0f} articles/s'.format(
+                output_format, size, best * 1e3, len(articles) / best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Measures every CPU bound stage a downloaded batch goes through: parsing the
+text export, encoding the articles to JSON, writing the JSON file and
+ingesting the articles into an SQLite database. Reports throughput, peak RSS
+and memory allocated by Python for each stage and compares them with a
+stored baseline, exiting with status 1 on a regression. Throughput is
+compared relative to the stdlib JSON encoder, timed alternately with every
+stage in the same process, so a baseline holds on other machines.
+
+The corpus is the sample data in ``ot/``, ``outt/`` and ``out/`` plus
+synthetic articles, delivered in batches like Nexis does.
+"""
+import json
+import multiprocessing
+import resource
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from os import path, unlink
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sample_corpus import render_export, sample_articles, synthetic_articles
+
+from nexis_db.Article import Article
+from nexis_db.DatabaseWriter import DatabaseWriter, SQLiteArticleTable
+from nexis_db.JSONEncoder import JSONEncoder
+from nexis_db.OutputWriter import write_result
+
+BASELINE = path.join(path.dirname(path.abspath(__file__)),
+                     'pipeline_baseline.json')
+# Throughput may drop and memory may grow by this share before a stage
+# counts as regressed
+TOLERANCE = 0.3
+
+
+def parse(exports, directory):
+    batches = [list(Article.from_nexis_text(text, None, None))
+               for text in exports]
+    return sum(len(text.encode('utf-8')) for text in exports), batches
+
+
+def encode(batches, directory):
+    encoder = JSONEncoder(indent=1)
+    return sum(len(encoder.encode(batch).encode('utf-8'))
+               for batch in batches), None
+
+
+def write(batches, directory):
+    size = 0
+    for index, batch in enumerate(batches):
+        filename = path.join(directory, '{}.json'.format(index))
+        write_result(filename, batch, 'json')
+        size += path.getsize(filename)
+    return size, None
+
+
+def ingest(batches, directory):
+    # A fresh database every time, updating rows costs differently
+    filename = path.join(directory, 'articles.sqlite')
+    table = SQLiteArticleTable(filename)
+    writer = DatabaseWriter(table)
+    try:
+        for batch in batches:
+            writer.write_all(batch)
+            writer.flush()
+        writer.close()
+    finally:
+        table.close()
+    size = path.getsize(filename)
+    unlink(filename)
+    return size, None
+
+
+def reference(records, directory):
+    """
+    Encodes the articles as plain dicts with the stdlib encoder, the speed of
+    the machine every stage is measured relative to.
+    """
+    encoder = json.JSONEncoder(indent=1)
+    return sum(len(encoder.encode(batch).encode('utf-8'))
+               for batch in records), None
+
+
+# parse gets the text exports, the others the articles parsed from them
+STAGES = (('parse', parse), ('encode', encode), ('write', write),
+          ('ingest', ingest))
+
+
+def _time(stage, data, records, repeat, connection):
+    with TemporaryDirectory() as directory:
+        best = best_reference = float('inf')
+        # Alternating with the reference, both see the same load
+        for _ in range(repeat):
+            start = perf_counter()
+            reference(records, directory)
+            best_reference = min(best_reference, perf_counter() - start)
+            start = perf_counter()
+            size, _ = stage(data, directory)
+            best = min(best, perf_counter() - start)
+    connection.send((best, best_reference, size))
+
+
+def _memory(stage, data, connection):
+    with TemporaryDirectory() as directory:
+        stage(data, directory)
+        # Peak of this process only, every stage runs in a fresh one
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        # Tracing slows everything down, so it gets a run of its own
+        tracemalloc.start()
+        stage(data, directory)
+        traced_peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    connection.send((peak_rss, traced_peak))
+
+
+def _in_fork(target, *args):
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=target, args=args + (sender,))
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def measure(stage, data, records, documents, repeat):
+    """
+    Runs the stage in forked processes so its peak RSS is its own.
+
+    :param records: The articles as plain dicts for the reference.
+    :return:        A dict holding the measurements.
+    """
+    best, best_reference, size = _in_fork(_time, stage, data, records,
+                                          repeat)
+    peak_rss, traced_peak = _in_fork(_memory, stage, data)
+    # Bytes read for parse, written for the others
+    return {'docs_per_s': documents / best,
+            'mb_per_s': size / 2**20 / best,
+            'relative': best_reference / best,
+            'peak_rss_mb': peak_rss,
+            'traced_peak_mb': traced_peak}
+
+
+def build_exports(args):
+    """
+    :return: The text exports of all batches and the number of articles.
+    """
+    articles = list(sample_articles()) * args.copies + list(
+        synthetic_articles(args.synthetic, args.words, args.attributes,
+                           args.german))
+    exports = [render_export(articles[start:start + args.batch_size])
+               for start in range(0, len(articles), args.batch_size)]
+    return exports, len(articles)
+
+
+def regressions(results, baseline, tolerance):
+    """
+    :return: Descriptions of all measurements worse than the baseline.
+    """
+    found = []
+    for stage, result in results.items():
+        expected = baseline.get(stage)
+        if expected is None:
+            continue
+        if result['relative'] < expected['relative'] * (1 - tolerance):
+            found.append('{}: {:.2f} times the reference speed, baseline '
+                         '{:.2f}'.format(stage, result['relative'],
+                                         expected['relative']))
+        if (result['traced_peak_mb'] >
+                expected['traced_peak_mb'] * (1 + tolerance)):
+            found.append('{}: {:.1f} MiB allocated, baseline {:.1f}'.format(
+                stage, result['traced_peak_mb'], expected['traced_peak_mb']))
+    return found
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-c', '--copies', type=int, default=3,
+                        help='How often the sample corpus is repeated.')
+    parser.add_argument('-s', '--synthetic', type=int, default=2000,
+                        help='Number of synthetic articles.')
+    parser.add_argument('-w', '--words', type=int, default=400,
+                        help='Words per synthetic article.')
+    parser.add_argument('-a', '--attributes', type=int, default=2,
+                        help='Extra attributes per synthetic article.')
+    parser.add_argument('-g', '--german', type=float, default=0.3,
+                        help='Share of synthetic articles with German '
+                             'attributes.')
+    parser.add_argument('-b', '--batch-size', type=int, default=200,
+                        help='Articles per downloaded batch.')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Number of measurements, the best is reported.')
+    parser.add_argument('--baseline', default=BASELINE,
+                        help='The JSON file holding the baseline.')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store the results as new baseline.')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='Share throughput may drop or allocated memory '
+                             'may grow before the run fails.')
+    args = parser.parse_args()
+
+    exports, documents = build_exports(args)
+    corpus = {name: getattr(args, name) for name in (
+        'copies', 'synthetic', 'words', 'attributes', 'german',
+        'batch_size')}
+    print('Corpus: {} articles in {} batches, {:.1f} MiB'.format(
+        documents, len(exports),
+        sum(len(text.encode('utf-8')) for text in exports) / 2**20))
+
+    batches = parse(exports, None)[1]
+    records = [json.loads(JSONEncoder().encode(batch)) for batch in batches]
+    results = {}
+    for name, stage in STAGES:
+        results[name] = measure(stage, batches if name != 'parse'
+                                else exports, records, documents, args.repeat)
+        print('{:>7}: {docs_per_s:9.0f} docs/s {relative:5.2f}x reference '
+              '{mb_per_s:7.2f} MiB/s {peak_rss_mb:8.1f} MiB peak RSS '
+              '{traced_peak_mb:8.1f} MiB allocated at peak'.format(
+                  name, **results[name]))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({'corpus': corpus, 'stages': results}, file, indent=1,
+                      sort_keys=True)
+        print('Saved the baseline to', args.baseline)
+        return
+
+    if not path.exists(args.baseline):
+        print('No baseline to compare with, store one with --save-baseline.')
+        return
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline['corpus'] != corpus:
+        print('The baseline was measured with another corpus:',
+              baseline['corpus'])
+        return
+    if any('relative' not in stage for stage in baseline['stages'].values()):
+        print('The baseline holds no reference speed, store a new one with '
+              '--save-baseline.')
+        return
+    found = regressions(results, baseline['stages'], args.tolerance)
+    for regression in found:
+        print('REGRESSION', regression)
+    if found:
+        sys.exit(1)
+    print('No regressions compared to', args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the Nexis web interface, serving just the pages and
+elements the crawler uses, with the sample data in ``ot/``, ``outt/`` and
+``out/`` as database. Point the crawler to it with ``--login-url``.
+"""
+import json
+import random
+import sys
+from argparse import ArgumentParser
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from sample_corpus import render_export, sample_articles
+
+from nexis_db.Article import parse_date
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Fake Nexis</title>
+<style>.hidden {{ display: none; }}</style></head>
+<body>{}</body></html>"""
+
+LOGIN_PAGE = """
+<form method="post" action="/login">
+ <input name="User"> <input name="Password" type="password">
+ <input name="submitimg" type="submit" value="Login">
+</form>"""
+
+TERMS_PAGE = """
+<p>Terms of use</p><a href="/auth/submitterms.do">Accept</a>"""
+
+RELOGIN_PAGE = """
+<p>You are logged in elsewhere already.</p>
+<table><tr><td><input type="button" title="OK" value="OK"
+ onclick="location.href='/start'"></td></tr></table>"""
+
+START_PAGE = """<a title="Profisuche" href="/search">Profisuche</a>"""
+
+# The search form, the search itself is submitted by script
+SEARCH_PAGE = """
+<textarea name="searchTermsTextArea"></textarea>
+<div rel="more_sources">More sources</div>
+<input id="selected_source">
+<ul class="ui-autocomplete hidden"><li>US Publications</li></ul>
+<select name="dateSelector">{date_options}</select>
+<input name="fromDate"> <input name="toDate">
+<input type="checkbox" name="gDuplicates">
+<a id="duplicatesModal" href="#">Duplicates</a>
+<div id="modal" class="hidden">
+ <input type="radio" name="threshold"
+  value="search.common.threshold.broadrange">
+ <button id="saveBooksBtn">OK</button>
+</div>
+<input type="checkbox" name="excludeObituariesChecked">
+<img title="Suche" alt="Suche" width="60" height="20" src="{pixel}">
+<script>
+function $(selector) {{ return document.querySelector(selector); }}
+$('#selected_source').addEventListener('input', function () {{
+  $('.ui-autocomplete').classList.remove('hidden');
+}});
+$('#duplicatesModal').addEventListener('click', function (event) {{
+  event.preventDefault();
+  $('#modal').classList.remove('hidden');
+}});
+$('#saveBooksBtn').addEventListener('click', function () {{
+  $('#modal').classList.add('hidden');
+}});
+$("img[title='Suche']").addEventListener('click', function () {{
+  location.href = '/results?' + new URLSearchParams({{
+    terms: $("textarea").value,
+    source: $('#selected_source').value,
+    fromDate: $("input[name='fromDate']").value,
+    toDate: $("input[name='toDate']").value}});
+}});
+</script>"""
+
+NO_RESULTS_PAGE = """<h1 class="zeroMsgHeader">No documents found</h1>"""
+
+TOO_MANY_PAGE = """
+<div id="popupContainer"><span class="l0">More than {} results</span></div>"""
+
+# The result list with the download popover, the download is requested by
+# script and started in a hidden frame
+RESULTS_PAGE = """
+<div><dl><dt>Results</dt><dd>{count} Dokumente und 0 Duplikate</dd></dl></div>
+<div><ol><li class="last"><a href="#">Forward</a></li></ol></div>
+<button id="delivery_DnldRender">Download</button>
+<div id="popover" class="hidden">
+ <div><ul>
+  <li><a href="#tabs-1">Range</a></li>
+  <li><a href="#tabs-2">Cover page</a></li>
+  <li><a href="#tabs-3">Format</a></li>
+ </ul></div>
+ <div id="tabs-1" class="tab">
+  <input type="radio" id="sel"> <input id="rangetextbox">
+  <select name="delView"><option>List</option><option>KWIC</option>
+   <option>Full</option><option>Full with indexing</option></select>
+ </div>
+ <div id="tabs-2" class="tab hidden"><input type="checkbox" id="cvpg"></div>
+ <div id="tabs-3" class="tab hidden">
+  <select id="delFmt"><option>HTML</option><option>RTF</option>
+   <option>PDF</option><option>Text</option></select>
+ </div>
+ <button class="deliverBtn">Deliver</button>
+ <div id="started" class="hidden">
+  Download started <button id="closeBtn">OK</button></div>
+ <div id="error" class="hidden"><div id="message"></div>
+  <a href="#"><span>close</span></a></div>
+</div>
+<iframe id="download" class="hidden"></iframe>
+<script>
+function $(selector) {{ return document.querySelector(selector); }}
+function show(selector, visible) {{
+  $(selector).classList.toggle('hidden', !visible);
+}}
+$('#delivery_DnldRender').addEventListener('click', function () {{
+  $('#rangetextbox').value = '';
+  $('#cvpg').checked = true;
+  document.querySelectorAll('.tab').forEach(function (tab) {{
+    show('#' + tab.id, tab.id == 'tabs-1');
+  }});
+  ['#started', '#error'].forEach(function (id) {{ show(id, false); }});
+  show('#popover', true);
+}});
+document.querySelectorAll("a[href^='#tabs-']").forEach(function (link) {{
+  link.addEventListener('click', function (event) {{
+    event.preventDefault();
+    document.querySelectorAll('.tab').forEach(function (tab) {{
+      show('#' + tab.id, '#' + tab.id == link.getAttribute('href'));
+    }});
+  }});
+}});
+$('.deliverBtn').addEventListener('click', function () {{
+  var query = {query} + '&range=' +
+    encodeURIComponent($('#rangetextbox').value);
+  fetch('/deliver?' + query).then(function (response) {{
+    return response.json();
+  }}).then(function (answer) {{
+    if (answer.error) {{
+      $('#message').innerHTML = answer.error;
+      show('#error', true);
+    }} else {{
+      show('#started', true);
+      $('#download').src = answer.url;
+    }}
+  }});
+}});
+$('#closeBtn').addEventListener('click', function () {{
+  show('#popover', false);
+}});
+$('#error a').addEventListener('click', function (event) {{
+  event.preventDefault();
+  show('#popover', false);
+}});
+</script>"""
+
+PIXEL = ('data:image/gif;base64,R0lGODlhAQABAIAAAP///wAAACH5BAEAAAAALAAAAAAB'
+         'AAEAAAICRAEAOw==')
+ERRORS = ('<h1>Partial Content</h1>',
+          '<span>Fehler bei der Anfrage</span>')
+
+
+def _parse_form_date(value, default):
+    try:
+        return datetime.strptime(value, '%d/%m/%Y').date()
+    except ValueError:
+        return default
+
+
+def query_name(index):
+    """
+    :return: The search term of the index-th query of the fake database.
+    """
+    return 'Company {}'.format(index)
+
+
+def build_database(articles, queries=10, copies=1):
+    """
+    Distributes the sample articles over the queries of the fake database
+    and gives every article a date.
+
+    :param queries: The number of queries, see query_name.
+    :param copies:  How often every article is repeated, to get bigger
+                    queries.
+    :return:        A dict mapping search terms to lists of (date, article)
+                    tuples sorted by date.
+    """
+    database = defaultdict(list)
+    first = date(2005, 1, 1)
+    days = (date.today() - first).days
+    for index, article in enumerate(articles):
+        found = parse_date(article.get('content', '')[:300]) or (
+            first + timedelta(days=index * 97 % days))
+        for copy in range(copies):
+            database[query_name(index % queries)].append(
+                (found - timedelta(days=copy), article))
+    for documents in database.values():
+        documents.sort(key=lambda document: document[0])
+    return dict(database)
+
+
+class FakeNexisServer(ThreadingHTTPServer):
+    """
+    Serves the fake Nexis pages in a background thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, database, latency=0.0, error_rate=0.0,
+                 max_results=3000, host='127.0.0.1', port=0):
+        """
+        :param database:    The documents, see build_database.
+        :param latency:     Seconds every request is delayed.
+        :param error_rate:  Probability of a download request failing with
+                            a "Partial Content" or request error.
+        :param max_results: Searches with more results are refused.
+        :param port:        The port to listen on, 0 for any free one.
+        """
+        ThreadingHTTPServer.__init__(self, (host, port), _Handler)
+        self.database = database
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_results = max_results
+        self.logged_in = set()
+        self.lock = Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+    @property
+    def login_url(self):
+        return self.base_url + '/login'
+
+    def search(self, terms, from_date, to_date):
+        """
+        :return: The documents of the search in the date range.
+        """
+        return [article for found, article
+                in self.database.get(terms.strip('"'), [])
+                if from_date <= found <= to_date]
+
+    def handle_error(self, request, client_address):
+        # Clients dropping kept alive connections are no errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(self, request, client_address)
+
+    def start(self):
+        self.thread = Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    # Keeps connections alive
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type='text/html; charset=utf-8',
+              headers=()):
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _redirect(self, location, headers=()):
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+
+    def _page(self, content):
+        self._send(PAGE.format(content))
+
+    def _search(self, query):
+        server = self.server
+        return server.search(
+            query.get('terms', [''])[0],
+            _parse_form_date(query.get('fromDate', [''])[0], date.min),
+            _parse_form_date(query.get('toDate', [''])[0], date.max))
+
+    def do_POST(self):
+        sleep(self.server.latency)
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        user = form.get('User', [''])[0]
+        with self.server.lock:
+            relogin = user in self.server.logged_in
+            self.server.logged_in.add(user)
+        self._redirect('/relogin' if relogin else '/terms',
+                       [('Set-Cookie', 'user=' + user)])
+
+    def do_GET(self):
+        server = self.server
+        sleep(server.latency)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path in ('/', '/login'):
+            self._page(LOGIN_PAGE)
+        elif url.path == '/terms':
+            self._page(TERMS_PAGE)
+        elif url.path == '/auth/submitterms.do':
+            self._redirect('/start')
+        elif url.path == '/relogin':
+            self._page(RELOGIN_PAGE)
+        elif url.path == '/start':
+            self._page(START_PAGE)
+        elif url.path == '/search':
+            self._page(SEARCH_PAGE.format(
+                pixel=PIXEL, date_options=''.join(
+                    '<option>{}</option>'.format(index)
+                    for index in range(12))))
+        elif url.path == '/results':
+            count = len(self._search(query))
+            if count == 0:
+                self._page(NO_RESULTS_PAGE)
+            elif count > server.max_results:
+                self._page(TOO_MANY_PAGE.format(server.max_results))
+            else:
+                self._page(RESULTS_PAGE.format(
+                    count=count, query=json.dumps(urlencode(
+                        {key: values[0] for key, values in query.items()}))
+                    .replace('</', '<\\/')))
+        elif url.path == '/deliver':
+            if random.random() < server.error_rate:
+                answer = {'error': random.choice(ERRORS)}
+            else:
+                answer = {'url': '/download?' + url.query}
+            self._send(json.dumps(answer), 'application/json')
+        elif url.path == '/download':
+            # Only for logged in sessions
+            if 'user=' not in self.headers.get('Cookie', ''):
+                self.send_error(403)
+                return
+            documents = self._search(query)
+            start, _, end = query.get('range', [''])[0].partition('-')
+            if start:
+                documents = documents[int(start) - 1:int(end or start)]
+            self._send(render_export(documents), 'text/plain; charset=utf-8',
+                       [('Content-Disposition',
+                         'attachment; filename="delivery.txt"')])
+        else:
+            self.send_error(404)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-p', '--port', type=int, default=8080)
+    parser.add_argument('-l', '--latency', type=float, default=0.0,
+                        help='Seconds every request is delayed.')
+    parser.add_argument('-e', '--error-rate', type=float, default=0.0,
+                        help='Probability of a failing download request.')
+    parser.add_argument('-q', '--queries', type=int, default=10,
+                        help='Number of queries the articles are spread over.')
+    parser.add_argument('-c', '--copies', type=int, default=1,
+                        help='How often every sample article is repeated.')
+    args = parser.parse_args()
+
+    server = FakeNexisServer(
+        build_database(sample_articles(), args.queries, args.copies),
+        args.latency, args.error_rate, port=args.port)
+    print('Serving', sum(map(len, server.database.values())),
+          'documents for', len(server.database), 'queries, log in at',
+          server.login_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
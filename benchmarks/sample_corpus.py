@@ -0,0 +1,125 @@
+"""
+Rebuilds Nexis text exports from the JSON samples in the repository so the
+parsing code can be benchmarked without access to the database.
+"""
+import json
+import random
+import sys
+from datetime import date
+from glob import glob
+from os.path import abspath, dirname, join
+
+ROOT = dirname(dirname(abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from nexis_db.Article import attributes, make_attribute_name
+
+SAMPLE_DIRS = ('ot', 'outt', 'out')
+# Those are written before the body in a real export, all others after it.
+HEADER_ATTRIBUTES = ('HEADLINE', 'BYLINE', 'SECTION', 'LENGTH', 'DATELINE',
+                     'UEBERSCHRIFT', 'AUTOR', 'RUBRIK', 'LAENGE')
+
+ATTRIBUTE_BY_NAME = {make_attribute_name(attr): attr for attr in attributes}
+
+
+def sample_articles(root=ROOT):
+    """
+    Yields all article dicts stored in the sample output directories.
+    """
+    for directory in SAMPLE_DIRS:
+        for filename in sorted(glob(join(root, directory, '*.json'))):
+            with open(filename) as file:
+                data = json.load(file)
+            if isinstance(data, list):
+                yield from data
+
+
+# The attributes of the header of synthetic articles, English and German
+HEADERS = {
+    'english': ('headline', 'byline', 'section', 'length', 'words'),
+    'german': ('ueberschrift', 'autor', 'rubrik', 'laenge', 'Wörter')}
+# Optional attributes of synthetic articles, with the values they get
+EXTRA_ATTRIBUTES = {
+    'dateline': lambda rand, day: ['BERLIN', day.strftime('%b %d, %Y')],
+    'load_date': lambda rand, day: [day.strftime('%B %d, %Y')],
+    'language': lambda rand, day: [rand.choice(('ENGLISH', 'GERMAN'))],
+    'subject': lambda rand, day: ['; '.join(
+        rand.sample(WORDS, 4)).upper()],
+    'company': lambda rand, day: [rand.choice(WORDS).title() + ' Inc.'],
+    'ticker': lambda rand, day: [rand.choice(WORDS)[:4].upper()],
+    'distribution': lambda rand, day: ['Business Editors'],
+    'country': lambda rand, day: ['UNITED STATES (92%); GERMANY (71%)']}
+WORDS = ('market company shares growth quarter revenue investors report '
+         'analysts profit bank chief executive board deal million billion '
+         'percent price sales customers energy software technology service '
+         'Unternehmen Aktie Wachstum Umsatz Gewinn Vorstand Markt').split()
+GERMAN_MONTHS = ('Januar Februar März April Mai Juni Juli August September '
+                 'Oktober November Dezember').split()
+
+
+def synthetic_articles(count, words=400, extra_attributes=2, german=0.0,
+                       seed=0):
+    """
+    Generates article dicts like the samples, with random text.
+
+    :param count:            The number of articles.
+    :param words:            The number of words of every body.
+    :param extra_attributes: The number of attributes from EXTRA_ATTRIBUTES
+                             every article gets on top of the header.
+    :param german:           The share of articles with German attributes
+                             and dates.
+    :param seed:             Seed of the random generator, the same seed
+                             gives the same articles.
+    """
+    rand = random.Random(seed)
+    start = date(2005, 1, 1).toordinal()
+    for _ in range(count):
+        day = date.fromordinal(start + rand.randrange(4000))
+        is_german = rand.random() < german
+        headline, byline, section, length, unit = HEADERS[
+            'german' if is_german else 'english']
+        if is_german:
+            published = '{}. {} {}'.format(
+                day.day, GERMAN_MONTHS[day.month - 1], day.year)
+        else:
+            published = day.strftime('%B %d, %Y %A')
+        body = ' '.join(rand.choice(WORDS) for _ in range(words))
+        article = {
+            headline: [' '.join(rand.sample(WORDS, 8)).capitalize()],
+            byline: [rand.choice(WORDS).title() + ' ' +
+                     rand.choice(WORDS).title()],
+            section: [rand.choice(WORDS).upper()],
+            length: ['{} {}'.format(words, unit)],
+            'content': 'Copyright {} Synthetic News\n\n{:>40}\n\n\n\n\n'
+                       'BODY:\n\n{}'.format(day.year, published, body)}
+        for name in rand.sample(sorted(EXTRA_ATTRIBUTES), extra_attributes):
+            article[name] = EXTRA_ATTRIBUTES[name](rand, day)
+        yield article
+
+
+def render_article(article: dict):
+    """
+    Renders an article dict the way Nexis writes it into a text export.
+    """
+    fields = {ATTRIBUTE_BY_NAME[key]: value for key, value in article.items()
+              if key in ATTRIBUTE_BY_NAME}
+    header = ''.join('{}: {}\n\n'.format(attr, '; '.join(fields[attr]))
+                     for attr in HEADER_ATTRIBUTES if attr in fields)
+    footer = ''.join('{}: {}\n\n'.format(attr, '; '.join(value))
+                     for attr, value in fields.items()
+                     if attr not in HEADER_ATTRIBUTES)
+
+    head, _, body = article['content'].partition('\n\n\n\n\n')
+    return head + '\n\n' + header + body + '\n\n' + footer
+
+
+def render_export(articles: list):
+    """
+    Renders a whole text export as downloaded from Nexis.
+    """
+    count = len(articles)
+    return '\ufeff' + ''.join(
+        '\n{:>40}\n\n{}\n'.format('Dokument {} von {}'.format(i, count),
+                                  render_article(article))
+        for i, article in enumerate(articles, 1))
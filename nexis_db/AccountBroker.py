@@ -0,0 +1,151 @@
+"""
+Hands out the Nexis accounts to the workers within the limits configured for
+every account.
+"""
+from collections import namedtuple
+from multiprocessing.managers import BaseManager
+from threading import Condition
+from time import monotonic
+
+# max_sessions: how many workers may use the account at the same time,
+# queries_per_minute: the rate queries are started at (None for no limit),
+# burst: how many queries may be started at once after a pause
+AccountLimits = namedtuple('AccountLimits',
+                           'max_sessions queries_per_minute burst')
+DEFAULT_LIMITS = AccountLimits(1, None, 1)
+
+
+def read_account_limits(config, users):
+    """
+    Reads the limits of the accounts from the users config file. Every
+    account can have its own section, e.g.::
+
+        [userdata]
+        alice = secret
+
+        [alice]
+        max_sessions = 2
+        queries_per_minute = 0.5
+        burst = 2
+
+    :param config: The ConfigParser holding the users file.
+    :param users:  The names of the accounts.
+    :return:       A dict mapping the user names to AccountLimits.
+    """
+    limits = {}
+    for user in users:
+        section = config[user] if config.has_section(user) else {}
+        rate = section.get('queries_per_minute')
+        limits[user] = AccountLimits(
+            int(section.get('max_sessions', DEFAULT_LIMITS.max_sessions)),
+            float(rate) if rate else None,
+            int(section.get('burst', DEFAULT_LIMITS.burst)))
+    return limits
+
+
+class AccountBroker:
+    """
+    Leases accounts to workers. Every account has a limit of concurrent
+    sessions and a token bucket limiting the rate queries are started at.
+    A worker keeps its account (and thus its logged in session) as long as
+    that account has tokens left and only switches if another one is free.
+
+    Runs in the server process of a BrokerManager, the workers use it
+    through a proxy.
+    """
+
+    def __init__(self, user_dict, limits=None):
+        """
+        :param user_dict: A dictionary holding usernames as keys and
+                          passwords as values.
+        :param limits:    A dict mapping usernames to AccountLimits, missing
+                          ones get DEFAULT_LIMITS.
+        """
+        limits = limits or {}
+        self.passwords = dict(user_dict)
+        self.limits = {user: limits.get(user, DEFAULT_LIMITS)
+                       for user in self.passwords}
+        self.sessions = {user: 0 for user in self.passwords}
+        self.tokens = {user: float(limit.burst)
+                       for user, limit in self.limits.items()}
+        self.updated = {user: monotonic() for user in self.passwords}
+        self.condition = Condition()
+
+    def _refill(self, user, now):
+        limit = self.limits[user]
+        if limit.queries_per_minute:
+            self.tokens[user] = min(
+                limit.burst, self.tokens[user] +
+                (now - self.updated[user]) * limit.queries_per_minute / 60)
+        self.updated[user] = now
+
+    def _time_to_token(self, user, now):
+        self._refill(user, now)
+        limit = self.limits[user]
+        if not limit.queries_per_minute or self.tokens[user] >= 1:
+            return 0
+        return (1 - self.tokens[user]) * 60 / limit.queries_per_minute
+
+    def _take_token(self, user):
+        if self.limits[user].queries_per_minute:
+            self.tokens[user] -= 1
+
+    def lease(self, current=None, avoid=None):
+        """
+        Blocks until the caller may start a query.
+
+        :param current: The account the caller holds from its last lease.
+        :param avoid:   An account that is only leased if no other one is
+                        ready, e.g. one a login just failed with.
+        :return:        A tuple (user, password) of the account to use. If
+                        it differs from ``current``, that one is released.
+        """
+        with self.condition:
+            while True:
+                now = monotonic()
+                if (current is not None and
+                        self._time_to_token(current, now) == 0):
+                    self._take_token(current)
+                    return current, self.passwords[current]
+
+                free = [user for user in self.passwords
+                        if user != current and
+                        self.sessions[user] < self.limits[user].max_sessions]
+                waits = {user: self._time_to_token(user, now)
+                         for user in free}
+                ready = [user for user in free if waits[user] == 0]
+                if avoid in ready and len(ready) > 1:
+                    ready.remove(avoid)
+                if ready:
+                    # Spread the load, prefer the account used least
+                    user = min(ready, key=lambda user: (
+                        self.sessions[user] / self.limits[user].max_sessions))
+                    self._take_token(user)
+                    self.sessions[user] += 1
+                    if current is not None:
+                        self._release(current)
+                    return user, self.passwords[user]
+
+                if current is not None:
+                    waits[current] = self._time_to_token(current, now)
+                self.condition.wait(min(waits.values()) if waits else None)
+
+    def _release(self, user):
+        self.sessions[user] -= 1
+        self.condition.notify_all()
+
+    def release(self, user):
+        """
+        Gives back the account leased last.
+        """
+        with self.condition:
+            self._release(user)
+
+
+class BrokerManager(BaseManager):
+    """
+    Runs an AccountBroker in a server process the workers talk to.
+    """
+
+
+BrokerManager.register('AccountBroker', AccountBroker)
@@ -1,4 +1,7 @@
 import re
+from codecs import getincrementaldecoder
+from datetime import date
+from functools import lru_cache
 
 attributes = [
     'ADVANCED-DATE', 'DATE', 'PUBLICATION', 'COMMITTEE', 'DISTRIBUTION',
@@ -24,29 +27,324 @@ attributes = [
     'TITEL-EINLEITUNG', 'TITOLO', 'TITRE', 'TTESTATA', 'TYPE', 'UEBERSCHRIFT',
     'UPDATGE', 'VILLE', 'VORSPANN']
 
+# Attributes that never hold a list of values. They are stored as one string
+# instead of a list of strings.
+single_valued_attributes = {
+    'ADVANCED-DATE', 'DATE', 'CORRECTION-DATE', 'D-DATE', 'DATA',
+    'DATA-CARICO', 'DATA-CORREZIONE', 'DATA-CHARGEMENT', 'DATA-ERRATUM',
+    'DATUM', 'KORREKTUR-DATUM', 'LAENGE', 'LENGTE', 'LENGTH', 'LOAD-DATE',
+    'LONGUEUR', 'LUNGHEZZA', 'UPDATGE', 'LANGUAGE', 'LANGUE', 'LINGUA',
+    'SPRACHE', 'TAAL', 'PUB-TYPE'}
+
+
+DOCUMENT_SEPARATOR_REGEX = re.compile(r'Dokument [0-9]+ von [0-9]+')
+
+# Matches the header of any known attribute, e.g. "\nHEADLINE: "
+ATTRIBUTE_REGEX = re.compile(
+    r'\n(' + '|'.join(re.escape(attr) for attr in attributes) + r'): ')
+
 
 def make_attribute_name(attr: str):
     return attr.lower().replace('-', '_')
 
 
+def _split_attribute_value(value: str):
+    return [elem.strip() for elem in value.split(';')]
+
+
+_MONTHS = {
+    'january': 1, 'jan': 1, 'januar': 1, 'jänner': 1,
+    'february': 2, 'feb': 2, 'februar': 2,
+    'march': 3, 'mar': 3, 'märz': 3, 'maerz': 3, 'mär': 3,
+    'april': 4, 'apr': 4,
+    'may': 5, 'mai': 5,
+    'june': 6, 'jun': 6, 'juni': 6,
+    'july': 7, 'jul': 7, 'juli': 7,
+    'august': 8, 'aug': 8,
+    'september': 9, 'sep': 9, 'sept': 9,
+    'october': 10, 'oct': 10, 'oktober': 10, 'okt': 10,
+    'november': 11, 'nov': 11,
+    'december': 12, 'dec': 12, 'dezember': 12, 'dez': 12}
+_MONTH_PATTERN = (r'\b(?P<month>' +
+                  '|'.join(sorted(_MONTHS, key=len, reverse=True)) + r')\.?')
+# Matches e.g. "July 16, 2013", "16 July 2013", "3. März 2015", "03.03.2015"
+# or "2015-03-03"
+_DATE_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    _MONTH_PATTERN + r'\s+(?P<day>\d{1,2}),?\s+(?P<year>\d{4})\b',
+    r'\b(?P<day>\d{1,2})\s+' + _MONTH_PATTERN + r',?\s+(?P<year>\d{4})\b',
+    r'\b(?P<day>\d{1,2})\.\s*' + _MONTH_PATTERN + r'\s+(?P<year>\d{4})\b',
+    r'\b(?P<day>\d{1,2})\.(?P<month>\d{1,2})\.(?P<year>\d{4})\b',
+    r'\b(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})\b'))
+_NUMBER_REGEX = re.compile(r'\d+(?:[.,]\d{3})*')
+
+# Attributes the typed fields of an article are taken from, by priority. If
+# none of them holds a date, the date line of the document header and then
+# the dateline are used.
+_LENGTH_NAMES = ('length', 'laenge', 'lengte', 'longueur', 'lunghezza')
+_DATE_NAMES = ('date', 'datum', 'load_date')
+# The first label, usually "BODY:", ends the document header of copyright,
+# publication and date lines
+_HEADER_END_REGEX = re.compile(r'\n[A-Z][A-Z-]*:')
+
+
+def _find_date(text):
+    """
+    :return: A tuple of the first date found in the text and the position it
+             starts at or (None, None).
+    """
+    found = None, None
+    for pattern in _DATE_PATTERNS:
+        match = pattern.search(text)
+        if match is None or (found[1] is not None and
+                             match.start() >= found[1]):
+            continue
+        month = match.group('month')
+        month = int(month) if month.isdigit() else _MONTHS[month.lower()]
+        try:
+            found = (date(int(match.group('year')), month,
+                          int(match.group('day'))),
+                     match.start())
+        except ValueError:
+            pass
+    return found
+
+
+@lru_cache(maxsize=4096)
+def parse_date(text: str):
+    """
+    Parses the first English or German date in the given text, e.g. from
+    "July 16, 2013 Tuesday", "Tuesday, 16 July 2013" or "3. März 2015
+    Dienstag".
+
+    :return: A datetime.date or None if there is no date.
+    """
+    return _find_date(text)[0]
+
+
+def parse_header_date(content: str):
+    """
+    :return: The date in the document header before the body, e.g. from the
+             line "October 19, 2015 Monday" below the publication, or None.
+    """
+    match = _HEADER_END_REGEX.search(content)
+    if match is None:
+        return None
+    # Line by line: the lines of headers repeat a lot, parse_date caches them
+    for line in content[:match.start()].splitlines():
+        line = line.strip()
+        if line:
+            found = parse_date(line)
+            if found is not None:
+                return found
+    return None
+
+
+def parse_word_count(text: str):
+    """
+    :return: The word count from a length like "875 words" or
+             "1.234 Wörter" or None.
+    """
+    match = _NUMBER_REGEX.search(text)
+    if match is None:
+        return None
+    return int(match.group().replace('.', '').replace(',', ''))
+
+
+@lru_cache(maxsize=4096)
+def _split_dateline(dateline):
+    """
+    :return: A tuple of the location and the date of a dateline, both may be
+             None.
+    """
+    found, start = _find_date(dateline)
+    return dateline[:start].strip(' ,;-') or None, found
+
+
+def parse_location(dateline: str):
+    """
+    :return: The location in a dateline like "LONDON, Sept. 15, 2015" or
+             None if there is none.
+    """
+    return _split_dateline(dateline)[0]
+
+
+def _decoded_lines(buffer, encoding):
+    """
+    Yields the lines of a binary file object or mmap as strings, translating
+    line endings like a file opened in text mode would.
+    """
+    decoder = getincrementaldecoder(encoding)()
+    for raw_line in iter(buffer.readline, b''):
+        line = decoder.decode(raw_line)
+        yield line.replace('\r\n', '\n').replace('\r', '\n')
+    yield decoder.decode(b'', final=True)
+
+
+_SINGLE_VALUED_NAMES = frozenset(map(make_attribute_name,
+                                    single_valued_attributes))
+_ATTRIBUTE_INDICES = {make_attribute_name(attr): index
+                      for index, attr in enumerate(attributes)}
+# Maps the names of the attributes an article has to their position in the
+# article's values. Shared by all articles with the same set of attributes.
+_layouts = {}
+
+
+def _get_layout(names):
+    layout = _layouts.get(names)
+    if layout is None:
+        layout = _layouts[names] = {
+            name: index for index, name in enumerate(names)}
+    return layout
+
+
 class Article:
+    """
+    A single document. Every attribute found in the document is available as
+    a member named via ``make_attribute_name``, attributes missing in the
+    document are not set at all.
+
+    The typed fields ``word_count`` (an int), ``publication_date`` (a
+    datetime.date) and ``location`` are parsed from the attributes, the date
+    also from the document header, once when the article is created. They
+    are None if they can't be found. ``duplicate_of`` is only set for
+    articles found in another query before, it holds the name of that
+    query.
+    """
+
+    # Big queries hold thousands of articles in memory: instead of a
+    # __dict__ per article only the values present are stored in a tuple.
+    __slots__ = ('content', 'company_canonical_name', 'company_name',
+                 'duplicate_of', 'word_count', 'publication_date', 'location',
+                 '_layout', '_values')
 
     def __init__(self, content: str, **kwargs):
         self.content = content
+        values = {}
+        others = {}
         for key, value in kwargs.items():
+            if key not in _ATTRIBUTE_INDICES:
+                others[key] = value
+            elif key in _SINGLE_VALUED_NAMES and isinstance(value, list):
+                values[key] = '; '.join(value)
+            else:
+                values[key] = value
+
+        names = tuple(sorted(values, key=_ATTRIBUTE_INDICES.__getitem__))
+        self._layout = _get_layout(names)
+        self._values = tuple(values[name] for name in names)
+        self._parse_typed_fields(values)
+        for key, value in others.items():
             setattr(self, key, value)
 
+    def _parse_typed_fields(self, values):
+        self.word_count = None
+        self.publication_date = None
+        self.location = None
+        for name in _LENGTH_NAMES:
+            if name in values:
+                self.word_count = parse_word_count(values[name])
+                break
+        for name in _DATE_NAMES:
+            if name in values:
+                self.publication_date = parse_date(values[name])
+                if self.publication_date is not None:
+                    break
+        if self.publication_date is None:
+            self.publication_date = parse_header_date(self.content)
+        dateline = values.get('dateline')
+        if dateline:
+            if isinstance(dateline, list):
+                dateline = '; '.join(dateline)
+            self.location, dateline_date = _split_dateline(dateline)
+            if self.publication_date is None:
+                self.publication_date = dateline_date
+
+    def __getattr__(self, name):
+        # Only called for attributes not stored in a slot
+        if not name.startswith('_'):
+            try:
+                return self._values[self._layout[name]]
+            except KeyError:
+                pass
+        raise AttributeError("'{}' object has no attribute '{}'".format(
+            type(self).__name__, name))
+
+    def _attribute_values(self):
+        """
+        Yields name, value for all attributes set, single valued attributes
+        are given as lists like the parser found them.
+        """
+        for name, value in zip(self._layout, self._values):
+            if name in _SINGLE_VALUED_NAMES:
+                value = _split_attribute_value(value)
+            yield name, value
+
     def __repr__(self):
         result = "<Article text=" + repr(self.content)
-        for attr in attributes:
-            value = getattr(self, make_attribute_name(attr), None)
-            if value is not None:
-                result += " " + make_attribute_name(attr) + "=" + repr(value)
+        for name, value in self._attribute_values():
+            result += " " + name + "=" + repr(value)
 
         return result + ">"
 
+    def __json__(self):
+        result = {'content': self.content}
+        result.update(self._attribute_values())
+        # The slots themselves, hasattr would go through __getattr__ for
+        # every one not set
+        for name, slot in _JSON_SLOTS:
+            try:
+                result[name] = slot.__get__(self)
+            except AttributeError:
+                pass
+        return result
+
     @classmethod
     def _single_article_from_text(cls, text, company_canonical_name, search_term):
+        """
+        Parses a single document in one pass over the text.
+
+        Every attribute is taken from its first occurrence and extends up to
+        the next blank line. If those spans overlap the result depends on the
+        order of ``attributes``, in that case the sequential parser is used.
+        """
+        spans = {}
+        for match in ATTRIBUTE_REGEX.finditer(text):
+            attribute = match.group(1)
+            if attribute not in spans:
+                end = text.find('\n\n', match.end() - 1)
+                spans[attribute] = (match.start(), match.end() - 1,
+                                    end if end != -1 else len(text))
+
+        ordered_spans = sorted(spans.values())
+        if any(next_start < end for (_, _, end), (next_start, _, _)
+               in zip(ordered_spans, ordered_spans[1:])):
+            kwargs, text = cls._parse_attributes_sequentially(text)
+        else:
+            kwargs = {make_attribute_name(attribute):
+                          _split_attribute_value(text[realstart:end])
+                      for attribute, (_, realstart, end) in spans.items()}
+            pieces = []
+            position = 0
+            for start, _, end in ordered_spans:
+                pieces.append(text[position:start])
+                position = end
+            pieces.append(text[position:])
+            text = ''.join(pieces)
+
+        kwargs['company_canonical_name'] = company_canonical_name
+        kwargs['company_name'] = search_term
+
+        return cls(text.strip(), **kwargs)
+
+    @staticmethod
+    def _parse_attributes_sequentially(text):
+        """
+        Extracts the attributes one after another in the order given by
+        ``attributes``, cutting each one out of the text before looking for
+        the next one.
+
+        :return: A tuple of the attribute kwargs and the remaining text.
+        """
         kwargs = {}
 
         for attribute in attributes:
@@ -55,14 +353,11 @@ class Article:
                 realstart = start+len(attribute)+2
                 end = text.find('\n\n', realstart)
                 end = end if end != -1 else len(text)
-                content = text[realstart:end].split(';')
-                kwargs[make_attribute_name(attribute)] = [
-                    elem.strip() for elem in content]
+                kwargs[make_attribute_name(attribute)] = (
+                    _split_attribute_value(text[realstart:end]))
                 text = text[:start] + text[end:]
-        kwargs['company_canonical_name'] = company_canonical_name
-        kwargs['company_name'] = search_term
 
-        return cls(text.strip(), **kwargs)
+        return kwargs, text
 
     @classmethod
     def from_nexis_text(cls, content, company_canonical_name, search_term):
@@ -73,9 +368,52 @@ class Article:
         """
         if content.startswith('\ufeff'):
             content = content[1:]
-        articles = re.split(r'Dokument [0-9]+ von [0-9]+', content)
+        articles = DOCUMENT_SEPARATOR_REGEX.split(content)
         for article in articles:
             article = article.strip()
             if not article:
                 continue
             yield cls._single_article_from_text(article, company_canonical_name, search_term)
+
+    @classmethod
+    def from_nexis_file(cls, source, company_canonical_name, search_term,
+                        encoding='utf-8'):
+        """
+        Yields all articles from the given text export one by one while
+        reading it. Only the document currently parsed is held in memory.
+
+        :param source:   A file name or a binary file object, e.g. an opened
+                         file or an mmap.
+        :param encoding: The encoding of the export.
+        """
+        if isinstance(source, str):
+            with open(source, 'rb') as file:
+                yield from cls.from_nexis_file(
+                    file, company_canonical_name, search_term, encoding)
+            return
+
+        lines = _decoded_lines(source, encoding)
+        document = []
+        for line in lines:
+            if not document and line.startswith('\ufeff'):
+                line = line[1:]
+            *finished, rest = DOCUMENT_SEPARATOR_REGEX.split(line)
+            for part in finished:
+                document.append(part)
+                article = ''.join(document).strip()
+                document = []
+                if article:
+                    yield cls._single_article_from_text(
+                        article, company_canonical_name, search_term)
+            document.append(rest)
+
+        article = ''.join(document).strip()
+        if article:
+            yield cls._single_article_from_text(
+                article, company_canonical_name, search_term)
+
+
+# The slots of an Article encoded besides its attributes, if set
+_JSON_SLOTS = tuple((name, getattr(Article, name))
+                    for name in ('company_canonical_name', 'company_name',
+                                 'duplicate_of'))
@@ -0,0 +1,77 @@
+class BatchSizer:
+    """
+    Decides how many documents are requested per download. Every download
+    costs a round trip through the delivery dialog no matter how big it is,
+    so the size grows while downloads succeed. A range Nexis fails to
+    deliver is split in half instead of being requested again as it is, the
+    first half is requested next. The reduced size is kept for a few
+    batches before it grows again, so the rest of the failed range isn't
+    requested at the size that just failed.
+    """
+
+    # The delivery dialog of Nexis refuses ranges of more than 500 documents
+    MAXIMUM = 500
+
+    def __init__(self, initial=200, maximum=MAXIMUM, growth=1.5, retries=3,
+                 hold=3):
+        """
+        :param initial: The size of the first batch.
+        :param maximum: The biggest batch Nexis delivers at once.
+        :param growth:  Factor the size grows by after every success.
+        :param retries: How often a single document that fails is
+                        requested again before giving up on it.
+        :param hold:    The number of successful batches the size stays the
+                        same after a failure.
+        """
+        self.initial = initial
+        self.size = initial
+        self.maximum = maximum
+        self.growth = growth
+        self.retries = retries
+        self.hold = hold
+        self._failures = 0
+        self._held = 0
+
+    def batch_end(self, batch_start, document_count):
+        """
+        :return: The last document of the batch starting at ``batch_start``.
+        """
+        return min(batch_start + self.size - 1, document_count)
+
+    def start_query(self):
+        """
+        Forgets the failures of the previous query. A size grown there is
+        kept, one shrunk below ``initial`` to get past a bad range is reset.
+        """
+        self.size = max(self.size, self.initial)
+        self._failures = 0
+        self._held = 0
+
+    def succeeded(self):
+        self._failures = 0
+        if self._held:
+            self._held -= 1
+            return
+        self.size = min(self.maximum, max(self.size + 1,
+                                          int(self.size * self.growth)))
+
+    def failed(self, batch_start, batch_end):
+        """
+        Shrinks the size after the range failed to download.
+
+        :return: False if the range was a single document which failed
+                 more than ``retries`` times and has to be skipped, True if
+                 it may be requested again.
+        """
+        self._held = self.hold
+        length = batch_end - batch_start + 1
+        if length > 1:
+            self.size = max(1, length // 2)
+            return True
+        self.size = 1
+        self._failures += 1
+        if self._failures <= self.retries:
+            return True
+        # Given up on, the next document gets all retries again
+        self._failures = 0
+        return False
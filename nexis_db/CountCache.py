@@ -0,0 +1,96 @@
+import sqlite3
+from datetime import date
+
+
+class CountCache:
+    """
+    Stores the number of results Nexis reported for a query and date range
+    in an SQLite database that can be shared by several processes.
+
+    Counts for ranges reaching up to the day they were probed on are only
+    valid on that day since Nexis may still add documents to them.
+    """
+
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename, timeout=60)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS counts ('
+                'search_term TEXT, languages TEXT, from_date TEXT, '
+                'to_date TEXT, count INTEGER, probed TEXT, '
+                'PRIMARY KEY (search_term, languages, from_date, to_date))')
+
+    def get(self, search_term, languages, from_date, to_date):
+        """
+        :return: A tuple (found, count), count is None for ranges with too
+                 many results.
+        """
+        row = self.connection.execute(
+            'SELECT count, probed FROM counts WHERE search_term=? AND '
+            'languages=? AND from_date=? AND to_date=?',
+            (search_term, languages, from_date.isoformat(),
+             to_date.isoformat())).fetchone()
+        if row is None:
+            return False, None
+        count, probed = row
+        today = date.today().isoformat()
+        if to_date.isoformat() >= probed and probed != today:
+            return False, None
+        return True, count
+
+    def estimate(self, search_term, languages, from_date, to_date):
+        """
+        Like get, but also returns outdated counts and, if the range is
+        unknown, the count of the longest known range with the same start
+        ending before. Good enough to estimate how big a query is.
+        """
+        row = self.connection.execute(
+            'SELECT count FROM counts WHERE search_term=? AND languages=? AND '
+            'from_date=? AND to_date<=? ORDER BY to_date DESC LIMIT 1',
+            (search_term, languages, from_date.isoformat(),
+             to_date.isoformat())).fetchone()
+        return (False, None) if row is None else (True, row[0])
+
+    def put(self, search_term, languages, from_date, to_date, count):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?, ?, ?)',
+                (search_term, languages, from_date.isoformat(),
+                 to_date.isoformat(), count, date.today().isoformat()))
+
+    def for_query(self, search_term, languages):
+        """
+        Returns a dict like view mapping (from_date, to_date) to the counts
+        for one query, as used by the PartitionPlanner.
+        """
+        return _QueryCounts(self, search_term, languages)
+
+    def close(self):
+        self.connection.close()
+
+
+class _QueryCounts:
+
+    def __init__(self, cache, search_term, languages):
+        self.cache = cache
+        self.search_term = search_term
+        self.languages = languages
+        self.known = {}
+
+    def __contains__(self, key):
+        if key not in self.known:
+            found, count = self.cache.get(self.search_term, self.languages,
+                                          *key)
+            if not found:
+                return False
+            self.known[key] = count
+        return True
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self.known[key]
+
+    def __setitem__(self, key, count):
+        self.known[key] = count
+        self.cache.put(self.search_term, self.languages, *key, count)
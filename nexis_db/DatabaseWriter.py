@@ -0,0 +1,233 @@
+"""
+Stores the downloaded articles in the article database. Articles are
+buffered and written in batches by a background thread, one transaction per
+batch, so a slow database never holds up the crawl.
+"""
+import json
+import sqlite3
+from datetime import date
+from queue import Queue
+from threading import Thread
+
+from pyprint.ClosableObject import ClosableObject
+
+from nexis_db.PrimitiveLogPrinter import PrimitiveLogPrinter
+
+# The columns of the article table
+COLUMNS = ('canonical_name', 'company_name', 'author', 'section', 'headline',
+           'length', 'content', 'date', 'location')
+# Articles are unique by these columns, storing an article again updates it
+UNIQUE_COLUMNS = ('canonical_name', 'headline', 'date')
+# NULLs are never equal, so the date can't be part of the key of articles
+# without one. The article table needs a partial unique index for each case,
+# given as (name, columns, condition). NULL company names and headlines are
+# stored as '' instead.
+UNIQUE_INDEXES = (
+    ('article_dated', UNIQUE_COLUMNS, 'date IS NOT NULL'),
+    ('article_undated', ('canonical_name', 'headline'), 'date IS NULL'))
+MISSING_KEYS = {'canonical_name': '', 'headline': ''}
+
+
+def _joined(value):
+    return '; '.join(value) if isinstance(value, list) else value
+
+
+def article_row(article):
+    """
+    Converts an Article into a dict holding the values for COLUMNS. The
+    length, date and location are the typed fields of the article. Missing
+    company names and headlines are replaced with the ones in MISSING_KEYS.
+    """
+    row = {
+        'canonical_name': getattr(article, 'company_canonical_name', None),
+        'company_name': getattr(article, 'company_name', None),
+        'author': _joined(getattr(article, 'byline', '')),
+        'section': getattr(article, 'section', []),
+        'headline': _joined(getattr(article, 'headline', '')),
+        'length': article.word_count,
+        'content': article.content,
+        'date': article.publication_date,
+        'location': article.location}
+    for column, missing in MISSING_KEYS.items():
+        if row[column] is None:
+            row[column] = missing
+    return row
+
+
+def _rows_by_index(rows):
+    """
+    Yields the name, columns and condition of every one of UNIQUE_INDEXES
+    with the rows it applies to, if there are any.
+    """
+    dated = [row for row in rows if row['date'] is not None]
+    undated = [row for row in rows if row['date'] is None]
+    for index, index_rows in zip(UNIQUE_INDEXES, (dated, undated)):
+        if index_rows:
+            yield index + (index_rows,)
+
+
+def _sqlite_value(value):
+    if isinstance(value, list):
+        return json.dumps(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+class SQLiteArticleTable:
+    """
+    A local SQLite stand-in for the article model, usable as ``insert_batch``
+    of a DatabaseWriter.
+    """
+
+    def __init__(self, filename):
+        # Used by the writer thread, not the one creating the table
+        self.connection = sqlite3.connect(filename, timeout=60,
+                                          check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS article (' +
+                ', '.join(COLUMNS) + ')')
+            for name, columns, condition in UNIQUE_INDEXES:
+                self.connection.execute(
+                    'CREATE UNIQUE INDEX IF NOT EXISTS {} ON article ({}) '
+                    'WHERE {}'.format(name, ', '.join(columns), condition))
+
+    def __call__(self, rows):
+        with self.connection:
+            for _, columns, condition, index_rows in _rows_by_index(rows):
+                updates = ', '.join(column + '=excluded.' + column
+                                    for column in COLUMNS
+                                    if column not in columns)
+                self.connection.executemany(
+                    'INSERT INTO article VALUES (' +
+                    ', '.join('?' * len(COLUMNS)) + ') ON CONFLICT (' +
+                    ', '.join(columns) + ') WHERE ' + condition +
+                    ' DO UPDATE SET ' + updates,
+                    [[_sqlite_value(row[column]) for column in COLUMNS]
+                     for row in index_rows])
+
+    def close(self):
+        self.connection.close()
+
+
+def peewee_insert_batch(model):
+    """
+    Returns an ``insert_batch`` callable for a DatabaseWriter storing the
+    rows with the given peewee model. The model needs the partial unique
+    indexes of UNIQUE_INDEXES.
+    """
+    # The conditions of UNIQUE_INDEXES as peewee expressions
+    conditions = dict(zip((name for name, _, _ in UNIQUE_INDEXES),
+                          (model.date.is_null(False), model.date.is_null())))
+
+    def insert_batch(rows):
+        with model._meta.database.atomic():
+            for name, columns, _, index_rows in _rows_by_index(rows):
+                model.insert_many(index_rows).on_conflict(
+                    conflict_target=[getattr(model, column)
+                                     for column in columns],
+                    conflict_where=conditions[name],
+                    preserve=[getattr(model, column) for column in COLUMNS
+                              if column not in columns]).execute()
+
+    return insert_batch
+
+
+class DatabaseWriteError(Exception):
+    pass
+
+
+class DatabaseWriter(ClosableObject):
+    """
+    Buffers articles and hands them to a background thread in batches.
+    Once a batch failed to be stored no further ones are: the next call to
+    ``add``, ``write_all``, ``flush`` or ``close`` and all after it raise a
+    DatabaseWriteError telling how many articles were lost.
+    """
+
+    def __init__(self, insert_batch, batch_size=500, to_row=article_row,
+                 printer=None):
+        """
+        :param insert_batch: A callable storing a list of row dicts in one
+                             transaction.
+        :param batch_size:   The number of articles stored at once.
+        :param to_row:       Converts an article into a row dict.
+        :param printer:      The PrimitiveLogPrinter errors are logged with.
+        """
+        ClosableObject.__init__(self)
+        self.insert_batch = insert_batch
+        self.batch_size = batch_size
+        self.to_row = to_row
+        self.printer = printer or PrimitiveLogPrinter()
+        self.buffer = []
+        self.count = 0
+        # The number of articles handed over but not stored
+        self.lost = 0
+        self.error = None
+        self.batches = Queue()
+        self.thread = Thread(target=self._write_batches, daemon=True)
+        self.thread.start()
+
+    def _write_batches(self):
+        for rows in iter(self.batches.get, None):
+            try:
+                if self.error is None:
+                    self.insert_batch(rows)
+                    self.count += len(rows)
+                else:
+                    self.lost += len(rows)
+            except BaseException as exception:
+                self.error = exception
+                self.lost += len(rows)
+                self.printer.err("Storing {} articles in the database "
+                                 "failed, no further ones are stored: {!r}"
+                                 .format(len(rows), exception))
+            finally:
+                self.batches.task_done()
+        self.batches.task_done()
+
+    def _check_error(self):
+        if self.error is not None:
+            raise DatabaseWriteError(
+                "Storing articles failed, {} were not stored: {!r}".format(
+                    self.lost + len(self.buffer), self.error)
+            ) from self.error
+
+    def add(self, article):
+        self._check_error()
+        self.buffer.append(self.to_row(article))
+        if len(self.buffer) >= self.batch_size:
+            self.batches.put(self.buffer)
+            self.buffer = []
+
+    def write_all(self, articles):
+        self._check_error()
+        for article in articles:
+            self.add(article)
+
+    def flush(self, wait=False):
+        """
+        Hands the buffered articles to the writer thread.
+
+        :param wait: Whether to block until everything is stored.
+        """
+        if self.buffer:
+            self.batches.put(self.buffer)
+            self.buffer = []
+        if wait:
+            self.batches.join()
+        self._check_error()
+
+    def _close(self):
+        if self.buffer and self.error is None:
+            self.batches.put(self.buffer)
+            self.buffer = []
+        self.batches.put(None)
+        self.thread.join()
+        if self.error is not None:
+            self.printer.err(self.lost + len(self.buffer), "articles were "
+                             "not stored in the database.")
+            # Closed already even though the error is raised
+            self._closed = True
+        self._check_error()
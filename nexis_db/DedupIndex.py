@@ -0,0 +1,166 @@
+"""
+Recognizes articles already downloaded for another query, also if their
+text differs slightly (e.g. the same wire story with another header).
+"""
+import re
+import sqlite3
+from hashlib import blake2b
+
+DEDUP_MODES = ('off', 'mark', 'skip')
+
+# Articles whose SimHashes differ in at most this many bits are duplicates
+MAX_DISTANCE = 3
+# The SimHash is split into MAX_DISTANCE + 1 bands, two near duplicates have
+# at least one of them in common
+BANDS = MAX_DISTANCE + 1
+BAND_BITS = 64 // BANDS
+# Texts with less shingles are only compared exactly
+MIN_SHINGLES = 10
+SHINGLE_SIZE = 3
+
+_WORD_REGEX = re.compile(r'\w+')
+# Start the text of a document, or at least end its header. The copyright,
+# publication and date lines of the header differ between the outlets
+# running the same story.
+_BODY_REGEX = re.compile(r'^BODY:', re.MULTILINE)
+_LABEL_REGEX = re.compile(r'^[A-Z][A-Z-]*:', re.MULTILINE)
+# Spreads the 8 bits of a byte into 8 counters of 32 bits, one table per
+# byte of a 64 bit feature hash. Summing those up counts the set bits of all
+# features at once.
+_COUNTER_BITS = 32
+_SPREAD_TABLES = tuple(
+    tuple(sum(((value >> bit) & 1) << ((8 * byte + bit) * _COUNTER_BITS)
+              for bit in range(8))
+          for value in range(256))
+    for byte in range(8))
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64 bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def body_text(content):
+    """
+    :return: The text of a document after its BODY: label. Without one
+             everything from the first label on, all of it if there is none.
+    """
+    match = _BODY_REGEX.search(content)
+    if match is not None:
+        return content[match.end():]
+    match = _LABEL_REGEX.search(content)
+    return content[match.start():] if match else content
+
+
+def content_hash(words):
+    """
+    :return: A hash of the words of a text, ignoring case and whitespace.
+    """
+    return blake2b(' '.join(words).encode(), digest_size=16).digest()
+
+
+def simhash(words):
+    """
+    Computes the 64 bit SimHash of the shingles of the given words.
+
+    :return: The SimHash or None if the text is too short.
+    """
+    count = len(words) - SHINGLE_SIZE + 1
+    if count < MIN_SHINGLES:
+        return None
+
+    counters = 0
+    for index in range(count):
+        digest = blake2b(' '.join(words[index:index+SHINGLE_SIZE]).encode(),
+                         digest_size=8).digest()
+        for table, value in zip(_SPREAD_TABLES, digest):
+            counters += table[value]
+
+    mask = (1 << _COUNTER_BITS) - 1
+    result = 0
+    for bit in range(64):
+        if ((counters >> (bit * _COUNTER_BITS)) & mask) * 2 > count:
+            result |= 1 << bit
+    return result
+
+
+def _bands(signature):
+    mask = (1 << BAND_BITS) - 1
+    return [(signature >> (band * BAND_BITS)) & mask for band in range(BANDS)]
+
+
+class DedupIndex:
+    """
+    Remembers the content hash and SimHash of every article and the query it
+    was first seen in, in an SQLite database that can be shared by several
+    processes. Near duplicates are found via an index on every band of the
+    SimHash so lookups only look at a few candidates.
+    """
+
+    def __init__(self, filename):
+        # Transactions are handled explicitly, see check
+        self.connection = sqlite3.connect(filename, timeout=60,
+                                          isolation_level=None)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS articles ('
+            'hash BLOB PRIMARY KEY, simhash INTEGER, query TEXT, ' +
+            ', '.join('band{} INTEGER'.format(band)
+                      for band in range(BANDS)) + ')')
+        for band in range(BANDS):
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS articles_band{0} ON articles '
+                '(band{0})'.format(band))
+
+    def _find(self, exact, signature):
+        row = self.connection.execute(
+            'SELECT query FROM articles WHERE hash=?', (exact,)).fetchone()
+        if row is not None or signature is None:
+            return row[0] if row else None
+
+        bands = _bands(signature)
+        for candidate, query in self.connection.execute(
+                'SELECT simhash, query FROM articles WHERE ' +
+                ' OR '.join('band{}=?'.format(band) for band in range(BANDS)),
+                bands):
+            if (candidate is not None and
+                    bin((candidate ^ _to_signed(signature)) &
+                        ((1 << 64) - 1)).count('1') <= MAX_DISTANCE):
+                return query
+        return None
+
+    def check(self, articles, query):
+        """
+        Looks up the given articles and adds the new ones to the index.
+
+        :param articles: The articles to check.
+        :param query:    The name of the query they belong to.
+        :return:         A list holding the query each article was first
+                         seen in or None for articles seen in no other query.
+        """
+        result = []
+        # Nobody else may add the same article between lookup and insert
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            for article in articles:
+                words = _WORD_REGEX.findall(
+                    body_text(article.content).lower())
+                exact, signature = content_hash(words), simhash(words)
+                first_query = self._find(exact, signature)
+                if first_query is None:
+                    self.connection.execute(
+                        'INSERT INTO articles VALUES (?, ?, ?, ' +
+                        ', '.join('?' * BANDS) + ')',
+                        [exact, None if signature is None
+                         else _to_signed(signature), query] +
+                        ([None] * BANDS if signature is None
+                         else _bands(signature)))
+                result.append(None if first_query in (None, query)
+                              else first_query)
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        return result
+
+    def close(self):
+        self.connection.close()
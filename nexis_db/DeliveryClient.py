@@ -0,0 +1,175 @@
+"""
+Fetches delivery files from Nexis directly over HTTP instead of through the
+download manager of the browser.
+"""
+import re
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from io import BufferedReader, RawIOBase
+from urllib.parse import urljoin, urlsplit
+
+from pyprint.ClosableObject import ClosableObject
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# Content types a text export is delivered with
+EXPORT_TYPES = ('text/plain', 'application/octet-stream')
+# Precedes every document of a text export, German or English
+DOCUMENT_MARKER_REGEX = re.compile(
+    rb'Dokument ([0-9]+) von ([0-9]+)|([0-9]+) of ([0-9]+) DOCUMENTS')
+
+
+def cookie_header(cookies, host, path='/', secure=False):
+    """
+    Builds the Cookie header a browser would send.
+
+    :param cookies: The cookies as returned by WebDriver.get_cookies(), dicts
+                    with name, value and optionally domain, path and secure.
+    :return:        The header value, empty if no cookie applies.
+    """
+    applicable = []
+    for cookie in cookies:
+        domain = cookie.get('domain', host).lstrip('.')
+        if host != domain and not host.endswith('.' + domain):
+            continue
+        if not path.startswith(cookie.get('path') or '/'):
+            continue
+        if cookie.get('secure') and not secure:
+            continue
+        applicable.append('{}={}'.format(cookie['name'], cookie['value']))
+    return '; '.join(applicable)
+
+
+class _PrefixedStream(RawIOBase):
+    """
+    Reads the bytes read from a stream already, then the rest of it.
+    """
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.prefix:
+            return self.stream.readinto(buffer)
+        length = min(len(buffer), len(self.prefix))
+        buffer[:length] = self.prefix[:length]
+        self.prefix = self.prefix[length:]
+        return length
+
+
+def open_export(response, document_count, head_size=4096):
+    """
+    Checks that a fetched file is the text export of the requested documents
+    before it is parsed: it has to be delivered as text and its first
+    document marker has to count the requested number of documents. Login
+    pages or error pages in place of the file don't pass.
+
+    :param response:       The HTTPResponse of the fetch.
+    :param document_count: The number of documents requested.
+    :param head_size:      The number of bytes the first marker is searched
+                           in.
+    :return:               A binary file object of the whole export or None
+                           if the file is something else. Its body has been
+                           read then.
+    """
+    content_type = (response.getheader('Content-Type') or '').partition(
+        ';')[0].strip().lower()
+    if response.status == 200 and content_type in EXPORT_TYPES:
+        head = response.read(head_size)
+        match = DOCUMENT_MARKER_REGEX.search(head)
+        if match is not None:
+            number, total = (int(group) for group in match.groups() if group)
+            if number == 1 and total == document_count:
+                return BufferedReader(_PrefixedStream(head, response))
+    response.read()
+    return None
+
+
+class DeliveryClient(ClosableObject):
+    """
+    Keeps one connection per server alive and fetches files with the
+    session of a browser, i.e. its cookies and user agent. The response body
+    is not read here, it can be streamed straight into the parser; it has to
+    be read completely before the next fetch to reuse the connection.
+    """
+
+    def __init__(self, timeout=600, max_redirects=5):
+        """
+        :param timeout:       Seconds a connection may be silent.
+        :param max_redirects: Number of redirects followed per fetch.
+        """
+        ClosableObject.__init__(self)
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        # Maps (scheme, netloc) to (connection, last response)
+        self.connections = {}
+
+    def _connection(self, scheme, netloc):
+        connection, response = self.connections.get(
+            (scheme, netloc), (None, None))
+        if connection is not None and (response is None or
+                                       response.isclosed()):
+            return connection
+        if connection is not None:
+            # The last body was not read to its end, the connection is
+            # unusable
+            connection.close()
+        connection_class = (HTTPSConnection if scheme == 'https'
+                            else HTTPConnection)
+        connection = connection_class(netloc, timeout=self.timeout)
+        self.connections[scheme, netloc] = connection, None
+        return connection
+
+    def _request(self, url, headers):
+        parts = urlsplit(url)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        # A kept alive connection may have been closed by the server in the
+        # meantime, that is only noticed when using it
+        for attempt in range(2):
+            connection = self._connection(parts.scheme, parts.netloc)
+            try:
+                connection.request('GET', target, headers=headers)
+                response = connection.getresponse()
+                break
+            except (HTTPException, ConnectionError):
+                connection.close()
+                del self.connections[parts.scheme, parts.netloc]
+                if attempt:
+                    raise
+        self.connections[parts.scheme, parts.netloc] = connection, response
+        return response
+
+    def fetch(self, url, cookies=(), headers=None):
+        """
+        Requests a file.
+
+        :param url:     The absolute URL of the file.
+        :param cookies: The cookies of the browser session, see
+                        cookie_header.
+        :param headers: Further headers, e.g. User-Agent and Referer.
+        :return:        The HTTPResponse, its status has to be checked by
+                        the caller.
+        """
+        for _ in range(self.max_redirects + 1):
+            parts = urlsplit(url)
+            request_headers = dict(headers or {})
+            cookie = cookie_header(cookies, parts.hostname, parts.path or '/',
+                                   parts.scheme == 'https')
+            if cookie:
+                request_headers['Cookie'] = cookie
+            response = self._request(url, request_headers)
+            location = response.getheader('Location')
+            if response.status not in REDIRECT_STATUSES or not location:
+                return response
+            response.read()
+            url = urljoin(url, location)
+        return response
+
+    def _close(self):
+        for connection, response in self.connections.values():
+            connection.close()
+        self.connections.clear()
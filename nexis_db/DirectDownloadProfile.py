@@ -1,6 +1,26 @@
 from selenium.webdriver.firefox.firefox_profile import FirefoxProfile
 
 
+def download_preferences(download_dir):
+    """
+    :return: A dict of the preferences making firefox store all downloads
+             noninteractively in the given directory.
+    """
+    return {
+        # use most recent download folder again
+        "browser.download.folderList": 2,
+        "browser.download.downloadDir": download_dir,
+        "browser.download.defaultFolder": download_dir,
+        "browser.download.dir": download_dir,
+        "browser.download.useDownloadDir": True,
+        "browser.download.manager.showWhenStarting": False,
+        "browser.helperApps.neverAsk.saveToDisk":
+            "application/msword,text/html,text/plain",
+        "browser.download.manager.showAlertOnComplete": False,
+        "browser.download.panel.shown": False,
+        "browser.download.useToolkitUI": True}
+
+
 class DirectDownloadProfile(FirefoxProfile):
     """
     This is a profile for selenium to automatically store all downloads
@@ -10,17 +30,5 @@ class DirectDownloadProfile(FirefoxProfile):
     def __init__(self, download_dir):
         FirefoxProfile.__init__(self)
 
-        # use most recent download folder again
-        self.set_preference("browser.download.folderList", 2)
-        self.set_preference("browser.download.downloadDir", download_dir)
-        self.set_preference("browser.download.defaultFolder", download_dir)
-        self.set_preference("browser.download.dir", download_dir)
-        self.set_preference("browser.download.useDownloadDir", True)
-        self.set_preference("browser.download.manager.showWhenStarting", False)
-        self.set_preference("browser.helperApps.neverAsk.saveToDisk",
-                            "application/msword,text/html,text/plain")
-        self.set_preference(
-            "browser.download.manager.showAlertOnComplete", False)
-        self.set_preference("browser.download.manager.showWhenStarting", False)
-        self.set_preference("browser.download.panel.shown", False)
-        self.set_preference("browser.download.useToolkitUI", True)
+        for name, value in download_preferences(download_dir).items():
+            self.set_preference(name, value)
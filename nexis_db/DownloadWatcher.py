@@ -0,0 +1,179 @@
+"""
+Detects when the browser has finished a download into a directory.
+"""
+import ctypes
+import os
+import select
+import sys
+from collections import namedtuple
+from ctypes.util import find_library
+from os import listdir, path, unlink
+from time import monotonic, sleep
+
+from pyprint.ClosableObject import ClosableObject
+
+# See inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE)
+
+CompletedDownload = namedtuple('CompletedDownload', 'path size stable')
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        return libc
+    except (OSError, AttributeError):  # pragma: no cover
+        return None
+
+
+class DownloadWatcher(ClosableObject):
+    """
+    Watches a download directory and reports the finished download.
+
+    Firefox writes into a ``.part`` file and moves it to its final name when
+    the download is complete. A download counts as finished as soon as there
+    is no ``.part`` file left and the remaining file did not change for
+    ``stable_interval`` seconds. On Linux this is driven by inotify events,
+    everywhere else (or if inotify is unavailable) the directory is polled.
+    """
+
+    def __init__(self, directory, stable_interval=0.5, poll_interval=0.2,
+                 use_inotify=True):
+        """
+        :param directory:       The directory to watch.
+        :param stable_interval: Time in seconds a finished file has to stay
+                                unchanged to be reported as stable.
+        :param poll_interval:   Time in seconds between two scans when
+                                polling.
+        :param use_inotify:     Set to False to always poll.
+        """
+        ClosableObject.__init__(self)
+        self.directory = directory
+        self.stable_interval = stable_interval
+        self.poll_interval = poll_interval
+        self.fd = None
+
+        libc = _load_libc() if use_inotify else None
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                if libc.inotify_add_watch(
+                        fd, os.fsencode(directory), WATCH_MASK) >= 0:
+                    self.fd = fd
+                else:  # pragma: no cover
+                    os.close(fd)
+
+    @property
+    def uses_inotify(self):
+        return self.fd is not None
+
+    def clear(self):
+        """
+        Removes all files from the directory, e.g. the remains of a download
+        given up on that would be taken for the next one otherwise.
+        """
+        for file in listdir(self.directory):
+            try:
+                unlink(path.join(self.directory, file))
+            except FileNotFoundError:
+                pass
+
+    def in_progress(self):
+        """
+        :return: Whether a download is being written into the directory,
+                 i.e. there is a ``.part`` file.
+        """
+        return any('.part' in file for file in listdir(self.directory))
+
+    def finished_download(self):
+        """
+        Checks the directory once.
+
+        :return: The path of the finished download or None if there is none
+                 or a download is still in progress.
+        """
+        files = listdir(self.directory)
+        if not files or any('.part' in file for file in files):
+            return None
+
+        return max((path.join(self.directory, file) for file in files),
+                   key=path.getmtime)
+
+    def _wait_for_change(self, timeout):
+        """
+        Blocks until the directory might have changed or the timeout (None
+        for no timeout) runs out.
+        """
+        if not self.uses_inotify:
+            sleep(self.poll_interval if timeout is None
+                  else max(0, min(timeout, self.poll_interval)))
+            return
+
+        timeout = None if timeout is None else max(0, timeout)
+        if select.select([self.fd], [], [], timeout)[0]:
+            # The events themselves are irrelevant, the directory is rescanned
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def wait(self, timeout=None):
+        """
+        Blocks until a download is finished.
+
+        :param timeout: Maximum time in seconds to wait, None waits forever.
+        :return:        A CompletedDownload. If the timeout ran out while the
+                        file was not yet stable, ``stable`` is False.
+        :raises TimeoutError: If no download finished in time.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        candidate, size, since = None, None, None
+
+        while True:
+            now = monotonic()
+            remaining = float('inf') if deadline is None else deadline - now
+
+            try:
+                finished = self.finished_download()
+                if finished is not None:
+                    current_size = path.getsize(finished)
+            except FileNotFoundError:  # Renamed while looking at it
+                finished = None
+
+            if finished is None:
+                candidate = None
+            elif finished != candidate or current_size != size:
+                candidate, size, since = finished, current_size, now
+            elif now - since >= self.stable_interval:
+                return CompletedDownload(candidate, size, True)
+
+            if remaining <= 0:
+                if candidate is not None:
+                    return CompletedDownload(candidate, size, False)
+                raise TimeoutError('No download finished in {} within {} '
+                                   'seconds.'.format(self.directory, timeout))
+
+            if candidate is not None:
+                remaining = min(remaining,
+                                since + self.stable_interval - now)
+            self._wait_for_change(
+                None if remaining == float('inf') else remaining)
+
+    def _close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,171 @@
+"""
+Keeps track of the state of every query and its downloaded batches on disk
+so an interrupted crawl can be resumed.
+"""
+import sqlite3
+from datetime import date, datetime
+
+PENDING = 'pending'
+IN_PROGRESS = 'in progress'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobManifest:
+    """
+    An SQLite backed record of all queries of a crawl. Every process has to
+    open its own JobManifest on the same file.
+    """
+
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename, timeout=60)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS queries ('
+                'name TEXT PRIMARY KEY, state TEXT, reason TEXT, '
+                'attempts INTEGER DEFAULT 0, document_count INTEGER, '
+                'updated TEXT)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS batches ('
+                'name TEXT, part TEXT, batch_start INTEGER, '
+                'batch_end INTEGER, '
+                'PRIMARY KEY (name, part, batch_start, batch_end))')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS skipped ('
+                'name TEXT, part TEXT, document INTEGER, updated TEXT, '
+                'PRIMARY KEY (name, part, document))')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS coverage ('
+                'name TEXT, languages TEXT, source TEXT, from_date TEXT, '
+                'to_date TEXT, PRIMARY KEY (name, languages, source))')
+
+    def _set(self, name, **values):
+        values['updated'] = datetime.now().isoformat()
+        columns = sorted(values)
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO queries (name) VALUES (?)', (name,))
+            self.connection.execute(
+                'UPDATE queries SET ' +
+                ', '.join(column + '=?' for column in columns) +
+                ' WHERE name=?',
+                [values[column] for column in columns] + [name])
+
+    def state(self, name):
+        """
+        :return: The state of the query or None if it is unknown.
+        """
+        row = self.connection.execute(
+            'SELECT state FROM queries WHERE name=?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def reason(self, name):
+        """
+        :return: Why the query failed, if it did.
+        """
+        row = self.connection.execute(
+            'SELECT reason FROM queries WHERE name=?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, name):
+        """
+        Registers a query as pending unless it is known already.
+        """
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO queries (name, state, updated) '
+                'VALUES (?, ?, ?)',
+                (name, PENDING, datetime.now().isoformat()))
+
+    def start(self, name):
+        with self.connection:
+            self.connection.execute(
+                'UPDATE queries SET attempts=attempts+1 WHERE name=?',
+                (name,))
+        self._set(name, state=IN_PROGRESS, reason=None)
+
+    def finish(self, name, document_count=None):
+        self._set(name, state=DONE, reason=None,
+                  document_count=document_count)
+        with self.connection:
+            self.connection.execute('DELETE FROM batches WHERE name=?',
+                                    (name,))
+
+    def retry(self, name, reason):
+        """
+        Marks a query as pending again after it went wrong.
+        """
+        self._set(name, state=PENDING, reason=reason)
+
+    def fail(self, name, reason):
+        self._set(name, state=FAILED, reason=reason)
+
+    def completed_batches(self, name, part):
+        """
+        :return: A set of (batch_start, batch_end) tuples downloaded for the
+                 given part of the query.
+        """
+        return set(self.connection.execute(
+            'SELECT batch_start, batch_end FROM batches WHERE name=? AND '
+            'part=?', (name, part)))
+
+    def all_batches(self, name):
+        """
+        :return: A sorted list of (part, batch_start, batch_end) tuples of
+                 all batches downloaded for the query.
+        """
+        return self.connection.execute(
+            'SELECT part, batch_start, batch_end FROM batches WHERE name=? '
+            'ORDER BY part, batch_start', (name,)).fetchall()
+
+    def complete_batch(self, name, part, batch_start, batch_end):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO batches VALUES (?, ?, ?, ?)',
+                (name, part, batch_start, batch_end))
+
+    def remove_batch(self, name, part, batch_start, batch_end):
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM batches WHERE name=? AND part=? AND '
+                'batch_start=? AND batch_end=?',
+                (name, part, batch_start, batch_end))
+
+    def skip_document(self, name, part, document):
+        """
+        Records a document Nexis failed to deliver. The record is kept when
+        the query finishes.
+        """
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO skipped VALUES (?, ?, ?, ?)',
+                (name, part, document, datetime.now().isoformat()))
+
+    def skipped_documents(self, name):
+        """
+        :return: A sorted list of (part, document) tuples of the documents
+                 skipped in the query.
+        """
+        return self.connection.execute(
+            'SELECT part, document FROM skipped WHERE name=? '
+            'ORDER BY part, document', (name,)).fetchall()
+
+    def coverage(self, name, languages, source):
+        """
+        :return: The (from_date, to_date) the output of the query holds the
+                 articles of, None if unknown.
+        """
+        row = self.connection.execute(
+            'SELECT from_date, to_date FROM coverage WHERE name=? AND '
+            'languages=? AND source=?', (name, languages, source)).fetchone()
+        return tuple(map(date.fromisoformat, row)) if row else None
+
+    def set_coverage(self, name, languages, source, from_date, to_date):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?)',
+                (name, languages, source, from_date.isoformat(),
+                 to_date.isoformat()))
+
+    def close(self):
+        self.connection.close()
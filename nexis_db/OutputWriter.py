@@ -0,0 +1,238 @@
+"""
+Writers for the output files, one per supported format. All of them write
+the articles one at a time as they are given.
+"""
+import gzip
+import io
+import json
+from os import replace
+
+from nexis_db.JSONEncoder import JSONEncoder
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+class OutputWriter:
+    """
+    Writes the results of one query into a file.
+    """
+
+    # The file name extension for this format, including the dot
+    extension = None
+
+    def __init__(self, filename, append=False):
+        """
+        :param filename: The file to write.
+        :param append:   Whether to append to an existing file instead of
+                         overwriting it, not supported by all formats.
+        """
+        self.filename = filename
+        self.file = self._open(filename, 'a' if append else 'w')
+
+    def _open(self, filename, mode):
+        return open(filename, mode)
+
+    @classmethod
+    def read(cls, filename):
+        """
+        Yields the articles of a file written in this format as dicts, or
+        the error dict written instead of them.
+        """
+        raise NotImplementedError
+
+    def write(self, article):
+        """
+        Writes a single article.
+        """
+        raise NotImplementedError
+
+    def write_all(self, articles):
+        """
+        Writes all articles from the given iterable.
+
+        :return: The number of articles written.
+        """
+        count = 0
+        for article in articles:
+            self.write(article)
+            count += 1
+        return count
+
+    def write_error(self, error: dict):
+        """
+        Writes the error dict of a query that could not be downloaded.
+        """
+        self.write(error)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JSONWriter(OutputWriter):
+    """
+    The original format, one JSON list holding all articles, indented by one
+    space. Byte-identical to ``json.dump(articles, file, indent=1)``.
+    """
+
+    extension = '.json'
+
+    def __init__(self, filename, append=False):
+        if append:
+            raise ValueError("The JSON format can't be appended to.")
+        OutputWriter.__init__(self, filename)
+        self.encoder = JSONEncoder(indent=1)
+        self.separator = '[\n '
+
+    @classmethod
+    def read(cls, filename):
+        with open(filename) as file:
+            result = json.load(file)
+        if isinstance(result, dict):
+            yield result
+        else:
+            yield from result
+
+    def write(self, article):
+        self.file.write(self.separator)
+        self.file.write(self.encoder.encode(article).replace('\n', '\n '))
+        self.separator = ',\n '
+
+    def write_error(self, error: dict):
+        json.dump(error, self.file, cls=JSONEncoder, indent=1)
+        self.separator = None
+
+    def close(self):
+        if self.separator is not None:
+            self.file.write('[]' if self.separator == '[\n ' else '\n]')
+        OutputWriter.close(self)
+
+
+class JSONLinesWriter(OutputWriter):
+    """
+    One compact JSON object per line. Can be appended to.
+    """
+
+    extension = '.jsonl'
+
+    def __init__(self, filename, append=False):
+        OutputWriter.__init__(self, filename, append)
+        self.encoder = JSONEncoder(separators=(',', ':'))
+
+    @staticmethod
+    def _open_read(filename):
+        return open(filename)
+
+    @classmethod
+    def read(cls, filename):
+        with cls._open_read(filename) as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+    def write(self, article):
+        self.file.write(self.encoder.encode(article))
+        self.file.write('\n')
+
+
+class GzipJSONLinesWriter(JSONLinesWriter):
+    """
+    JSON lines compressed with gzip. Appending adds a new gzip member, which
+    gzip readers handle transparently.
+    """
+
+    extension = '.jsonl.gz'
+
+    def _open(self, filename, mode):
+        return gzip.open(filename, mode + 't', compresslevel=6)
+
+    @staticmethod
+    def _open_read(filename):
+        return gzip.open(filename, 'rt')
+
+
+class ZstdJSONLinesWriter(JSONLinesWriter):
+    """
+    JSON lines compressed with zstandard, needs the ``zstandard`` package.
+    Appending adds a new frame.
+    """
+
+    extension = '.jsonl.zst'
+
+    def _open(self, filename, mode):
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is needed to write "
+                               "zstd compressed output.")
+        raw = open(filename, mode + 'b')
+        return io.TextIOWrapper(
+            zstandard.ZstdCompressor().stream_writer(raw), encoding='utf-8')
+
+    @staticmethod
+    def _open_read(filename):
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is needed to read "
+                               "zstd compressed output.")
+        # Every append added a frame of its own
+        return io.TextIOWrapper(
+            zstandard.ZstdDecompressor().stream_reader(
+                open(filename, 'rb'), read_across_frames=True),
+            encoding='utf-8')
+
+
+OUTPUT_FORMATS = {
+    'json': JSONWriter,
+    'jsonl': JSONLinesWriter,
+    'jsonl.gz': GzipJSONLinesWriter,
+    'jsonl.zst': ZstdJSONLinesWriter}
+
+
+def write_result(filename, result, output_format='json'):
+    """
+    Writes the result of a query.
+
+    :param filename:      The file to write.
+    :param result:        An error dict or an iterable of articles.
+    :param output_format: One of OUTPUT_FORMATS.
+    """
+    with OUTPUT_FORMATS[output_format](filename) as writer:
+        if isinstance(result, dict):
+            writer.write_error(result)
+        else:
+            writer.write_all(result)
+
+
+def merge_result(filename, articles, output_format='json'):
+    """
+    Adds articles to an existing output file, e.g. the ones of a delta crawl
+    whose dates overlap the ones of the file. Articles with the same content
+    as one in the file are left out, an error written by an earlier crawl is
+    dropped. The file is rewritten and replaced when complete.
+
+    :param filename:      The file holding the earlier articles.
+    :param articles:      An iterable of the new articles.
+    :param output_format: One of OUTPUT_FORMATS.
+    :return:              The number of articles added.
+    """
+    writer_class = OUTPUT_FORMATS[output_format]
+    contents = set()
+    count = 0
+    with writer_class(filename + '.tmp') as writer:
+        for earlier in writer_class.read(filename):
+            if 'error_code' not in earlier:
+                contents.add(earlier.get('content'))
+                writer.write(earlier)
+        for article in articles:
+            if article.content not in contents:
+                contents.add(article.content)
+                writer.write(article)
+                count += 1
+    replace(filename + '.tmp', filename)
+    return count
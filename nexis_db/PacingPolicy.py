@@ -0,0 +1,49 @@
+from random import random
+from time import monotonic, sleep
+
+
+class PacingPolicy:
+    """
+    Decides how long to pause between two actions on the Nexis web interface
+    so the crawler does not hammer the server. This is only about politeness,
+    waiting for the page itself is done by the PageWaiter.
+    """
+
+    def __init__(self, min_delay=1.0, jitter=2.0, max_delay=None,
+                 actions_per_minute=None):
+        """
+        :param min_delay:          Seconds to pause at least.
+        :param jitter:             Up to this many seconds are randomly added
+                                   to ``min_delay``.
+        :param max_delay:          Upper limit for a single pause, None for
+                                   no limit.
+        :param actions_per_minute: Limits the number of paced actions per
+                                   minute for the session using this policy,
+                                   None for no limit. Accounts allowing
+                                   several sessions get the limit per
+                                   session.
+        """
+        self.min_delay = min_delay
+        self.jitter = jitter
+        self.max_delay = max_delay
+        self.actions_per_minute = actions_per_minute
+        self._last_action = None
+
+    def delay(self):
+        """
+        Returns the number of seconds to pause before the next action.
+        """
+        delay = self.min_delay + random()*self.jitter
+        if self.actions_per_minute and self._last_action is not None:
+            next_allowed = self._last_action + 60/self.actions_per_minute
+            delay = max(delay, next_allowed - monotonic())
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return max(delay, 0)
+
+    def pause(self):
+        """
+        Sleeps until the next action may be performed.
+        """
+        sleep(self.delay())
+        self._last_action = monotonic()
@@ -0,0 +1,80 @@
+from collections import defaultdict
+from time import monotonic
+
+from selenium.common.exceptions import (NoSuchElementException,
+                                        StaleElementReferenceException,
+                                        TimeoutException)
+from selenium.webdriver.support.ui import WebDriverWait
+
+
+def any_element_located(*locators):
+    """
+    An expected condition that is met as soon as one of the given elements
+    is present.
+
+    :param locators: (By, value) tuples.
+    :return:         A condition returning the tuple (locator, element) for
+                     the first locator that matched.
+    """
+    def condition(browser):
+        for locator in locators:
+            elements = browser.find_elements(*locator)
+            if elements:
+                return locator, elements[0]
+        return False
+    return condition
+
+
+class PageWaiter:
+    """
+    Waits for page states with selenium's expected conditions and records how
+    long every named step took.
+    """
+
+    def __init__(self, browser, timeout=30, poll_frequency=0.2):
+        """
+        :param browser:        The WebDriver to wait on.
+        :param timeout:        Default seconds to wait for a condition.
+        :param poll_frequency: Seconds between two checks of a condition.
+        """
+        self.browser = browser
+        self.timeout = timeout
+        self.poll_frequency = poll_frequency
+        # Step name -> list of seconds it took each time
+        self.timings = defaultdict(list)
+
+    def until(self, step, condition, timeout=None, required=True):
+        """
+        Waits until the condition is met.
+
+        :param step:      A name for what is waited for, used for timings.
+        :param condition: An expected condition, a callable receiving the
+                          browser.
+        :param timeout:   Seconds to wait, the default timeout if None.
+        :param required:  If False, a timeout is not an error.
+        :return:          The return value of the condition or None if it
+                          was not met and not required.
+        """
+        wait = WebDriverWait(
+            self.browser, self.timeout if timeout is None else timeout,
+            self.poll_frequency,
+            (NoSuchElementException, StaleElementReferenceException))
+        start = monotonic()
+        try:
+            return wait.until(condition, "Waiting for '{}' timed out."
+                              .format(step))
+        except TimeoutException:
+            if required:
+                raise
+            return None
+        finally:
+            self.timings[step].append(monotonic() - start)
+
+    def summary(self):
+        """
+        Returns a human readable overview of the recorded timings.
+        """
+        return '\n'.join(
+            '{}: {} times, avg {:.2f}s, max {:.2f}s'.format(
+                step, len(times), sum(times)/len(times), max(times))
+            for step, times in sorted(self.timings.items()))
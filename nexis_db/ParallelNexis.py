@@ -2,12 +2,22 @@
 Contains a class and utilities that allow to do multiple queries to the nexis
 db in parallel.
 """
-from datetime import datetime
+from contextlib import contextmanager
 from multiprocessing import Process, Queue, cpu_count
 from multiprocessing.queues import Empty
+from time import monotonic
 
-from nexis_db.nexis import Nexis
+from pyvirtualdisplay.display import Display
+
+from nexis_db.AccountBroker import BrokerManager, DEFAULT_LIMITS
+from nexis_db.CountCache import CountCache
+from nexis_db.JobManifest import JobManifest
 from nexis_db.PrimitiveLogPrinter import PrimitiveLogPrinter
+from nexis_db.ProfileTemplate import allowed_domains, build_profile
+from nexis_db.ResultSink import BatchStore
+from nexis_db.Scheduler import Scheduler
+from nexis_db.TaskRunner import TaskRunner
+from nexis_db.ThreadEngine import ThreadEngine
 
 
 def get_cpu_count():
@@ -18,96 +28,250 @@ def get_cpu_count():
         return 2
 
 
+@contextmanager
+def shared_display(display_mode, hide=True, printer=PrimitiveLogPrinter()):
+    """
+    Starts one virtual display for all browsers if the display mode asks
+    for it. Processes started within the with block inherit it via the
+    DISPLAY environment variable.
+    """
+    display = None
+    if hide and display_mode == 'shared':
+        with printer.do_safe_action(
+                'Starting shared virtual display',
+                "Browser windows cannot be hidden. You might need to install "
+                "Xvfb. Continuing with visible browser windows."):
+            display = Display(visible=0)
+            display.start()
+    try:
+        yield display
+    finally:
+        if display is not None:
+            display.stop()
+
+
 def do_parallel_queries(rows: list, job_count: int, user_dict: {str: str},
-                        hide=True, ignore_big_queries=True):
+                        hide=True, ignore_big_queries=True, pacing=None,
+                        display_mode='private', count_cache_file=None,
+                        manifest_file=None, batch_dir=None, dedup_file=None,
+                        dedup_mode='off', account_limits=None,
+                        engine='processes', login_url=None,
+                        parse_workers=0, direct_download=False,
+                        block_images=True, allow_domains=()):
     """
     Yields name, results for successful queries.
 
     :param rows:      The CSV rows (dict) to query
-    :param job_count: Number of processes to launch
+    :param job_count: Maximum number of processes to launch, by default as
+                      many as the accounts allow sessions.
     :param user_dict: A dictionary holding usernames as keys and passwords as
                       values.
     :param hide:      Whether or not to show the actual browser windows.
+    :param pacing:    The PacingPolicy each session uses between actions.
+    :param display_mode: One of nexis.DISPLAY_MODES. With 'shared' one
+                         virtual display is started here and used by all
+                         workers.
+    :param count_cache_file: An SQLite file used as CountCache by all
+                             workers.
+    :param manifest_file:    The file of the JobManifest recording the
+                             state of the queries and their batches.
+    :param batch_dir:        The directory downloaded batches are kept in
+                             until their query is finished. If given, only
+                             the number of results is yielded instead of
+                             the results, they have to be read from the
+                             BatchStore of the query.
+    :param parse_workers:    Number of threads every session parses
+                             downloaded batches with while downloading the
+                             next ones, 0 to parse before downloading on.
+    :param direct_download:  Fetch delivered files over HTTP with the
+                             cookies of the browser instead of through its
+                             download manager.
+    :param block_images:     Whether browsers load no images.
+    :param allow_domains:    Domains browsers may load from besides the ones
+                             of Nexis and the login page.
+    """
+    # All browsers share one profile, built here once
+    started = monotonic()
+    profile = build_profile(allowed_domains(login_url, allow_domains),
+                            block_images)
+    print('Built the browser profile in {:.3f} s.'.format(
+        monotonic() - started))
+
+    if engine == 'threads' and display_mode == 'private':
+        # A virtual display is set for the whole process via DISPLAY, the
+        # sessions of one process can only share one
+        display_mode = 'shared'
+    with shared_display(display_mode, hide):
+        yield from _run_workers(
+            rows, job_count, user_dict, hide=hide,
+            ignore_big_queries=ignore_big_queries, pacing=pacing,
+            display_mode=display_mode, count_cache_file=count_cache_file,
+            manifest_file=manifest_file, batch_dir=batch_dir,
+            dedup_file=dedup_file, dedup_mode=dedup_mode,
+            account_limits=account_limits, engine=engine,
+            login_url=login_url, parse_workers=parse_workers,
+            direct_download=direct_download, profile=profile)
+
+
+def _count_estimator(count_cache):
+    """
+    Returns an estimate function for the Scheduler looking up the number of
+    results earlier runs found in the count cache.
+    """
+    def estimate(row, from_date, to_date):
+        if count_cache is None:
+            return None
+        found, count = count_cache.estimate(
+            row['name'], row.get('languages', 'us'), from_date, to_date)
+        if not found:
+            return None
+        return False if count is None else count
+
+    return estimate
+
+
+def _run_workers(rows, job_count, user_dict, account_limits=None,
+                 engine='processes', **worker_options):
+    account_limits = account_limits or {}
+    session_budget = sum(account_limits.get(user, DEFAULT_LIMITS).max_sessions
+                         for user in user_dict)
+    # Big queries are split into one part per worker that may run, fewer
+    # workers than that are only started if there are fewer tasks
+    budget = min(job_count or session_budget, session_budget)
+    count_cache_file = worker_options['count_cache_file']
+    count_cache = CountCache(count_cache_file) if count_cache_file else None
+    try:
+        scheduler = Scheduler(
+            rows, _count_estimator(count_cache), split_parts=budget,
+            split=not worker_options['ignore_big_queries'])
+    finally:
+        if count_cache is not None:
+            count_cache.close()
+    job_count = min(budget, len(scheduler.tasks))
+
+    engine = ENGINES[engine](job_count, user_dict, account_limits,
+                             worker_options)
+    manifest = (JobManifest(worker_options['manifest_file'])
+                if worker_options['manifest_file'] else None)
+    i = 0
+    try:
+        # Every worker gets one task, the next when it is done with it
+        for _ in range(job_count):
+            engine.put(*scheduler.next_task())
+        while not scheduler.finished:
+            message = engine.get()
+            if message is None:
+                print('All workers exited, giving up on the remaining '
+                      'queries.')
+                break
+            attempt, task, message = message
+            if message is None:
+                scheduler.retry(attempt + 1, task)
+            following = scheduler.next_task()
+            if following is not None:
+                engine.put(*following)
+            if message is None:
+                continue
+            task_id, result, used = message
+
+            finished = scheduler.complete(task_id, result, used)
+            if finished is None:  # Other parts of the query are missing
+                continue
+            i += 1
+            name, result, used = finished
+            if result is None:  # This one went wrong :(
+                continue
+            if manifest is not None and used is not None:
+                # The parts of a split query can't tell which batches of
+                # earlier attempts became obsolete, only all together can
+                store = BatchStore(manifest, worker_options['batch_dir'],
+                                   name)
+                store.used = used
+                store.remove_unused()
+
+            if type(result) != dict:
+                print('['+str(i)+'/'+str(len(rows))+']', "Got",
+                      result if type(result) == int else len(result),
+                      "results for", name)
+            else:
+                print('['+str(i)+'/'+str(len(rows))+']',
+                      'Got no results for', name, ' (too many).')
+            yield name, result
+    finally:
+        engine.close()
+        if manifest is not None:
+            manifest.close()
+
+
+class _ProcessEngine:
     """
-    job_count = min(job_count or get_cpu_count(), len(rows), len(user_dict))
-    task_queue = Queue()
-    for row in rows:
-        task_queue.put((0, row))
-
-    result_queue = Queue()
-    users = list(user_dict.keys())
-    processes = [Worker(task_queue, result_queue,
-                        users[i], user_dict[users[i]], hide,
-                        ignore_big_queries=ignore_big_queries)
-                 for i in range(0, job_count)]
-    for process in processes:
-        process.start()
-
-    for i in range(0, len(rows)):
-        retval = result_queue.get()
-        if retval is None:  # This one went wrong :(
-            continue
-        name, result = retval
-        if type(result) != dict:
-            print('['+str(i+1)+'/'+str(len(rows))+']', "Got",
-                  len(result), "results for", name)
-        else:
-            print('['+str(i+1)+'/'+str(len(rows))+']',
-                  'Got no results for', name, ' (too many).')
-        yield name, result
-
-    # Join *after* getting queues, otherwise deadlock
-    for process in processes:
-        process.join()
+    Runs every session in a Worker process of its own.
+
+    ``put`` hands an (attempt, task) to the next idle worker, ``get`` returns
+    the next (attempt, task, message) tuple. The message is the (task_id,
+    result, used) tuple for the Scheduler, None if the task failed and has
+    to be retried.
+    """
+
+    def __init__(self, job_count, user_dict, account_limits, worker_options):
+        self.task_queue = Queue()
+        self.result_queue = Queue()
+        # Workers lease the accounts from the broker for every task
+        self.manager = BrokerManager()
+        self.manager.start()
+        broker = self.manager.AccountBroker(user_dict, account_limits)
+        self.processes = [Worker(self.task_queue, self.result_queue, broker,
+                                 **worker_options)
+                          for i in range(0, job_count)]
+        for process in self.processes:
+            process.start()
+
+    def put(self, attempt, task):
+        self.task_queue.put((attempt, task))
+
+    def get(self):
+        """
+        :return: The next result or None if all workers are gone.
+        """
+        while True:
+            try:
+                return self.result_queue.get(timeout=10)
+            except Empty:
+                if not any(process.is_alive() for process in self.processes):
+                    return None
+
+    def close(self):
+        # Workers exit when they get a sentinel instead of a task
+        for process in self.processes:
+            self.task_queue.put(None)
+        # Join *after* getting queues, otherwise deadlock
+        for process in self.processes:
+            process.join()
+        self.manager.shutdown()
 
 
 class Worker(Process):
 
-    def __init__(self, task_queue, result_queue, user, password, hide=True,
-                 ignore_big_queries=True):
+    def __init__(self, task_queue, result_queue, broker, **options):
+        """
+        :param options: The options for the TaskRunner.
+        """
         Process.__init__(self)
         self.task_queue = task_queue
         self.result_queue = result_queue
-        self.hide = hide
-        self.user = user
-        self.password = password
-        self.ignore_big_queries = ignore_big_queries
+        self.broker = broker
+        self.options = options
 
     def run(self):
-        printer = PrimitiveLogPrinter(True)
-        nexis = Nexis(user=self.user, password=self.password,
-                      hide_window=self.hide, printer=printer,
-                      ignore_big_queries=self.ignore_big_queries)
+        # SQLite connections must not be shared with the parent process
+        runner = TaskRunner(self.broker, **self.options)
         try:
-            while True:
-                attempt, row = self.task_queue.get(timeout=1)
-                name = row['name']
-                try:
-                    from_date = datetime.strptime(row['from date'], '%d-%m-%Y')
-                    to_date = datetime.strptime(row['to date'], '%d-%m-%Y')
-                except:
-                    from_date, to_date = None, None
-                languages = row.get('languages', 'us')
-                if attempt > 2:
-                    printer.err("Maximum attempts for task", name,
-                                "exceeded. Dropping.")
-                    self.result_queue.put(None)
-                    continue
-                try:
-                    company_canonical_name = row['company canononical name']
-                except:
-                    company_canonical_name = None
-                try:
-                    result = nexis.query(name, from_date, to_date, languages,company_canonical_name=company_canonical_name)
-                    self.result_queue.put((name, result))
-                except:
-                    printer.warn("Error while querying for", name,
-                                 ". Restarting query later...")
-                    nexis.close()
-                    nexis = Nexis(user=self.user, password=self.password,
-                                  hide_window=self.hide, printer=printer)
-                    self.task_queue.put((attempt+1, row))
-        except Empty:
-            pass
+            for attempt, task in iter(self.task_queue.get, None):
+                # Retries go back to the Scheduler to keep its order
+                self.result_queue.put(
+                    (attempt, task, runner.run(attempt, task)))
         finally:
-            nexis.close()
+            runner.close()
+
+
+ENGINES = {'processes': _ProcessEngine, 'threads': ThreadEngine}
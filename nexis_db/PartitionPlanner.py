@@ -0,0 +1,110 @@
+from datetime import timedelta
+
+
+def split_date_range(from_date, to_date, parts):
+    """
+    Splits the inclusive date range into the given number of consecutive,
+    (nearly) equally long ranges.
+
+    :return: A list of (from_date, to_date) tuples.
+    """
+    days = (to_date - from_date).days + 1
+    parts = max(1, min(parts, days))
+    bounds = [from_date + timedelta(days=days*i//parts)
+              for i in range(parts + 1)]
+    return [(start, end - timedelta(days=1))
+            for start, end in zip(bounds, bounds[1:])]
+
+
+class PartitionPlanner:
+    """
+    Splits the date range of a query into sub ranges that each stay below
+    the maximum number of results Nexis delivers.
+
+    The range is walked from its start. The length of every sub range is
+    taken from the result density, the number of results per day, of the
+    last range whose count is known, so a range is probed about once
+    instead of being halved again and again. A range with too many results
+    only tells that the density is higher than the maximum allows, the
+    estimate is raised and a shorter range is probed. Probed counts are kept
+    in a cache so reruns don't have to probe again.
+    """
+
+    def __init__(self, probe, cache=None, max_results=3000, fill_ratio=0.8,
+                 overflow_factor=2):
+        """
+        :param probe:           A callable taking from_date and to_date and
+                                returning the number of results for that
+                                range or None if there are more than
+                                ``max_results``.
+        :param cache:           A dict like object mapping (from_date,
+                                to_date) to the probed count.
+        :param max_results:     The maximum number of results per range.
+        :param fill_ratio:      Ranges are planned to hold this fraction of
+                                ``max_results`` to leave room for estimation
+                                errors.
+        :param overflow_factor: If the count of a range is unknown because it
+                                exceeds ``max_results`` it is estimated as
+                                this multiple of ``max_results``.
+        """
+        self.probe = probe
+        self.cache = {} if cache is None else cache
+        self.max_results = max_results
+        self.fill_ratio = fill_ratio
+        self.overflow_factor = overflow_factor
+
+    def count(self, from_date, to_date):
+        """
+        Returns the number of results in the range (None if too many),
+        probing only if it is not cached.
+        """
+        key = (from_date, to_date)
+        if key not in self.cache:
+            self.cache[key] = self.probe(from_date, to_date)
+        return self.cache[key]
+
+    def _density(self, count, days):
+        """
+        :return: The results per day of a range, estimated from
+                 ``overflow_factor`` if the count is unknown.
+        """
+        if count is None:
+            count = self.overflow_factor * self.max_results
+        return count / days
+
+    def plan(self, from_date, to_date):
+        """
+        Plans the sub ranges for the given inclusive date range.
+
+        :return: A list of (from_date, to_date, count) tuples. The count is
+                 None for single days that still exceed the maximum.
+        """
+        count = self.count(from_date, to_date)
+        if count is not None and count <= self.max_results:
+            return [(from_date, to_date, count)]
+        if from_date >= to_date:
+            return [(from_date, to_date, count)]
+
+        density = self._density(count, (to_date - from_date).days + 1)
+        result = []
+        start = from_date
+        while start <= to_date:
+            remaining = (to_date - start).days + 1
+            if density:
+                days = max(1, min(remaining, int(
+                    self.max_results * self.fill_ratio / density)))
+            else:
+                days = remaining
+            end = start + timedelta(days=days - 1)
+            count = self.count(start, end)
+            too_many = count is None or count > self.max_results
+            if too_many and days > 1:
+                # Denser than estimated, a shorter range is probed
+                density = max(density, self._density(count, days))
+                continue
+
+            result.append((start, end, count))
+            if count is not None:
+                density = self._density(count, days)
+            start = end + timedelta(days=1)
+        return result
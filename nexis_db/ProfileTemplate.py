@@ -0,0 +1,133 @@
+"""
+A lean firefox profile built once per run and shared by all browsers.
+"""
+import json
+from shutil import rmtree
+from tempfile import mkdtemp
+from urllib.parse import quote, urlsplit
+
+from selenium.webdriver.firefox.firefox_profile import FirefoxProfile
+
+# Hosts the Nexis login and search pages are served from, anything else is
+# blocked unless allowed explicitly
+NEXIS_DOMAINS = ('lexisnexis.com', 'uni-hamburg.de', 'uni-regensburg.de')
+
+# Nothing of that is needed to click through Nexis
+LEAN_PREFERENCES = {
+    # Updates, extensions and telemetry
+    'app.update.enabled': False,
+    'app.update.auto': False,
+    'extensions.update.enabled': False,
+    'extensions.update.autoUpdateDefault': False,
+    'extensions.getAddons.cache.enabled': False,
+    'extensions.blocklist.enabled': False,
+    'datareporting.healthreport.uploadEnabled': False,
+    'datareporting.policy.dataSubmissionEnabled': False,
+    'toolkit.telemetry.enabled': False,
+    'toolkit.telemetry.unified': False,
+    'browser.safebrowsing.malware.enabled': False,
+    'browser.safebrowsing.phishing.enabled': False,
+    'browser.safebrowsing.downloads.enabled': False,
+    'browser.search.update': False,
+    'media.gmp-manager.updateEnabled': False,
+    'browser.shell.checkDefaultBrowser': False,
+    'browser.startup.page': 0,
+    'browser.startup.homepage': 'about:blank',
+    'browser.newtabpage.enabled': False,
+    # Speculative connections
+    'network.prefetch-next': False,
+    'network.dns.disablePrefetch': True,
+    'network.http.speculative-parallel-limit': 0,
+    # Session restore, history and cache
+    'browser.sessionstore.resume_from_crash': False,
+    'browser.sessionstore.interval': 600000,
+    'browser.sessionstore.max_tabs_undo': 0,
+    'browser.sessionhistory.max_entries': 5,
+    'places.history.enabled': False,
+    'browser.cache.disk.enable': False,
+    'browser.cache.offline.enable': False,
+    'browser.cache.memory.capacity': 16384,
+    # Media and fonts
+    'media.autoplay.enabled': False,
+    'media.autoplay.default': 1,
+    'gfx.downloadable_fonts.enabled': False,
+    'browser.display.use_document_fonts': 0}
+
+# Requests to other hosts go to a proxy that does not exist and fail at once
+_PAC_SCRIPT = """function FindProxyForURL(url, host) {{
+  var allowed = {};
+  for (var i = 0; i < allowed.length; i++) {{
+    if (host == allowed[i] || dnsDomainIs(host, '.' + allowed[i]))
+      return 'DIRECT';
+  }}
+  return 'PROXY 127.0.0.1:9';
+}}"""
+
+
+def allowed_domains(login_url=None, extra=()):
+    """
+    :return: The domains browsers may load from: the Nexis ones, the host of
+             the login page and the given extra ones.
+    """
+    domains = list(NEXIS_DOMAINS) + list(extra)
+    if login_url:
+        domains.append(urlsplit(login_url).hostname)
+    return domains
+
+
+class ProfileTemplate(FirefoxProfile):
+    """
+    A profile without updates, telemetry, caches and session restore that
+    blocks images, media, web fonts and all hosts not allowed. Selenium zips
+    and encodes a profile for every browser it starts, build_profile encodes
+    this one once for all of them; the per browser settings like the
+    download directory are passed as preferences of the Options instead.
+    """
+
+    def __init__(self, domains=None, block_images=True):
+        """
+        :param domains:      The domains pages may load anything from, see
+                             allowed_domains. None allows all.
+        :param block_images: Whether to load no images.
+        """
+        FirefoxProfile.__init__(self)
+        for name, value in LEAN_PREFERENCES.items():
+            self.set_preference(name, value)
+        if block_images:
+            self.set_preference('permissions.default.image', 2)
+        if domains is not None:
+            self.set_preference('network.proxy.type', 2)
+            self.set_preference(
+                'network.proxy.autoconfig_url',
+                'data:text/javascript,' + quote(_PAC_SCRIPT.format(
+                    json.dumps(sorted(set(domains))))))
+
+
+def build_profile(domains=None, block_images=True):
+    """
+    Builds a ProfileTemplate, see there for the parameters.
+
+    :return: The encoded profile for EncodedProfile.
+    """
+    template = ProfileTemplate(domains, block_images)
+    try:
+        return template.encoded
+    finally:
+        rmtree(template.path, ignore_errors=True)
+
+
+class EncodedProfile(FirefoxProfile):
+    """
+    Hands a profile encoded by build_profile, possibly in another process,
+    to a browser.
+    """
+
+    def __init__(self, encoded):
+        # Nothing to copy, the directory only exists to be removed on quit
+        self.profile_dir = mkdtemp()
+        self.tempfolder = None
+        self._encoded = encoded
+
+    @property
+    def encoded(self):
+        return self._encoded
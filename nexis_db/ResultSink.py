@@ -0,0 +1,220 @@
+"""
+Destinations for the articles Nexis downloads, batch by batch.
+"""
+import json
+from os import makedirs, path, remove, replace
+from shutil import rmtree
+
+from nexis_db.Article import Article
+from nexis_db.JSONEncoder import JSONEncoder
+
+
+def date_range_key(from_date, to_date):
+    return '{}..{}'.format(from_date.isoformat(), to_date.isoformat())
+
+
+class ResultSink:
+    """
+    Receives the articles of a query batch by batch as soon as they are
+    downloaded.
+    """
+
+    def load(self, date_range, batch_start, batch_end):
+        """
+        Returns the articles of a batch received earlier or None if it has
+        to be downloaded.
+
+        :param date_range: The (from_date, to_date) of the searched part.
+        """
+        return None
+
+    def stored_batch_end(self, date_range, batch_start):
+        """
+        Batch sizes change from run to run, a resumed query asks with this
+        which batch it received earlier starts at ``batch_start``.
+
+        :return: The end of the longest such batch or None if there is none.
+        """
+        return None
+
+    def add(self, date_range, batch_start, batch_end, articles):
+        """
+        Receives the articles of a downloaded batch.
+        """
+        raise NotImplementedError
+
+    def skip(self, date_range, document):
+        """
+        Receives the number of a document Nexis failed to deliver, it is
+        missing from the result.
+        """
+
+    def result(self):
+        """
+        Returns what Nexis.query returns when the query is done.
+        """
+        raise NotImplementedError
+
+
+class ListSink(ResultSink):
+    """
+    Collects all articles in memory, the result is the list of them.
+    """
+
+    def __init__(self):
+        self.articles = []
+
+    def add(self, date_range, batch_start, batch_end, articles):
+        self.articles += articles
+
+    def result(self):
+        return self.articles
+
+
+class DedupSink(ResultSink):
+    """
+    Checks the articles of every batch against a DedupIndex before passing
+    them on to another sink. Articles first seen in another query are marked
+    with the name of that query in ``duplicate_of`` or dropped.
+    """
+
+    def __init__(self, sink, index, name, mode='mark'):
+        """
+        :param sink:  The ResultSink receiving the checked batches.
+        :param index: The DedupIndex shared by all queries.
+        :param name:  The name of the query.
+        :param mode:  'mark' or 'skip'.
+        """
+        self.sink = sink
+        self.index = index
+        self.name = name
+        self.mode = mode
+
+    def load(self, date_range, batch_start, batch_end):
+        return self.sink.load(date_range, batch_start, batch_end)
+
+    def stored_batch_end(self, date_range, batch_start):
+        return self.sink.stored_batch_end(date_range, batch_start)
+
+    def add(self, date_range, batch_start, batch_end, articles):
+        checked = []
+        for article, first_query in zip(
+                articles, self.index.check(articles, self.name)):
+            if first_query is None:
+                checked.append(article)
+            elif self.mode == 'mark':
+                article.duplicate_of = first_query
+                checked.append(article)
+        self.sink.add(date_range, batch_start, batch_end, checked)
+
+    def skip(self, date_range, document):
+        self.sink.skip(date_range, document)
+
+    def result(self):
+        return self.sink.result()
+
+
+class BatchStore(ResultSink):
+    """
+    Writes every batch of one query to its own file as soon as it arrives and
+    records it in the JobManifest. A resumed query takes the batches it
+    already has from here instead of downloading them again. Only the number
+    of articles is kept in memory, that is also the result.
+    """
+
+    def __init__(self, manifest, directory, name, cleanup=True):
+        """
+        :param manifest:  The JobManifest of the crawl.
+        :param directory: The directory holding the batches of all queries.
+        :param name:      The name of the query.
+        :param cleanup:   Whether ``result`` removes unused batches. Stores
+                          receiving only a part of a query must leave that to
+                          whoever combines the parts.
+        """
+        self.manifest = manifest
+        self.name = name
+        self.cleanup = cleanup
+        self.directory = path.join(
+            directory, name.replace(' ', '_').replace('/', '_'))
+        # The (part, batch_start, batch_end) forming the result of this run
+        self.used = set()
+        self.count = 0
+
+    def _filename(self, part, batch_start, batch_end):
+        return path.join(self.directory, '{}_{}-{}.json'.format(
+            part, batch_start, batch_end))
+
+    def _read(self, part, batch_start, batch_end):
+        with open(self._filename(part, batch_start, batch_end)) as file:
+            return [Article(**record) for record in json.load(file)]
+
+    def load(self, date_range, batch_start, batch_end):
+        part = date_range_key(*date_range)
+        if ((batch_start, batch_end) not in
+                self.manifest.completed_batches(self.name, part)):
+            return None
+        try:
+            articles = self._read(part, batch_start, batch_end)
+        except (OSError, ValueError):
+            return None
+
+        self.used.add((part, batch_start, batch_end))
+        self.count += len(articles)
+        return articles
+
+    def stored_batch_end(self, date_range, batch_start):
+        ends = [end for start, end in self.manifest.completed_batches(
+            self.name, date_range_key(*date_range)) if start == batch_start]
+        return max(ends, default=None)
+
+    def add(self, date_range, batch_start, batch_end, articles):
+        part = date_range_key(*date_range)
+        makedirs(self.directory, exist_ok=True)
+        filename = self._filename(part, batch_start, batch_end)
+        with open(filename + '.tmp', 'w') as file:
+            json.dump(articles, file, cls=JSONEncoder)
+        replace(filename + '.tmp', filename)
+        self.manifest.complete_batch(self.name, part, batch_start, batch_end)
+
+        self.used.add((part, batch_start, batch_end))
+        self.count += len(articles)
+
+    def skip(self, date_range, document):
+        """
+        Records the document in the JobManifest. It is not stored as a batch,
+        a resumed query tries it again.
+        """
+        self.manifest.skip_document(self.name, date_range_key(*date_range),
+                                    document)
+
+    def result(self):
+        """
+        Returns the number of articles after removing unused batches if
+        ``cleanup`` is set.
+        """
+        if self.cleanup:
+            self.remove_unused()
+        return self.count
+
+    def remove_unused(self):
+        """
+        Drops batches left over from earlier attempts that did not become
+        part of the result (e.g. because the document count changed since).
+        """
+        for batch in self.manifest.all_batches(self.name):
+            if batch not in self.used:
+                self.manifest.remove_batch(self.name, *batch)
+                try:
+                    remove(self._filename(*batch))
+                except FileNotFoundError:
+                    pass
+
+    def articles(self):
+        """
+        Yields all stored articles, reading one batch at a time.
+        """
+        for batch in self.manifest.all_batches(self.name):
+            yield from self._read(*batch)
+
+    def clear(self):
+        rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,191 @@
+"""
+Decides in which order the queries are handed to the workers and splits big
+ones into parts that can be downloaded by several workers at once.
+"""
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from heapq import heapify, heappop, heappush
+
+from nexis_db.nexis import DEFAULT_FROM_DATE
+from nexis_db.PartitionPlanner import split_date_range
+
+# A unit of work for one worker: the whole query of the CSV row or, if
+# date_range is set, only that part of it
+Task = namedtuple('Task', 'id row date_range cost')
+
+# Assumed number of results of a query nobody counted yet
+UNKNOWN_COST = 1500
+
+
+def row_dates(row):
+    """
+    :return: The from and to date of a CSV row, each None if not given.
+    """
+    try:
+        return (datetime.strptime(row['from date'], '%d-%m-%Y'),
+                datetime.strptime(row['to date'], '%d-%m-%Y'))
+    except:
+        return None, None
+
+
+def default_dates(row):
+    """
+    :return: The dates a query for the row covers, with the defaults
+             Nexis.query uses for missing ones.
+    """
+    from_date, to_date = row_dates(row)
+    return (from_date.date() if from_date else DEFAULT_FROM_DATE,
+            to_date.date() if to_date else date.today())
+
+
+def uncovered_range(from_date, to_date, covered, overlap=1):
+    """
+    Finds what a delta crawl has to query. The result always overlaps,
+    adjoins or contains the covered range so both together form one range
+    again. Like in the CountCache, counts of ranges reaching the day they
+    were crawled on are not final: Nexis still adds articles for the last
+    days, so the last ``overlap`` days covered are queried again.
+
+    :param covered: The (from_date, to_date) downloaded already or None.
+    :param overlap: The number of covered days to query again.
+    :return:        The (from_date, to_date) to query, None if the whole
+                    range is covered already.
+    """
+    if covered is None:
+        return from_date, to_date
+    covered_from, covered_to = covered
+    if from_date >= covered_from:
+        if to_date <= covered_to:
+            return None
+        return (max(covered_from, covered_to - timedelta(days=overlap - 1)),
+                to_date)
+    if to_date <= covered_to:
+        return from_date, covered_from - timedelta(days=1)
+    return from_date, to_date
+
+
+class _Query:
+
+    def __init__(self, name, task_ids):
+        self.name = name
+        self.pending = set(task_ids)
+        self.results = {}
+        self.used = set()
+        self.failed = False
+
+
+class Scheduler:
+    """
+    Orders the queries by their estimated number of results, biggest first,
+    since a big query started last keeps one worker busy while all others
+    are idle. Queries expected to have more results than can be downloaded
+    at once are split into parts by date, idle workers pick them up while
+    the others are still busy. The results of the parts are combined once
+    all of them are done.
+
+    Tasks are handed out one at a time to idle workers with ``next_task``.
+    A failed task is given back with ``retry`` and keeps its place in that
+    order instead of waiting behind all others.
+    """
+
+    def __init__(self, rows, estimate, split_threshold=3000, split_parts=4,
+                 split=True):
+        """
+        :param rows:            The CSV rows (dict) to query.
+        :param estimate:        A callable taking a row, the from and the to
+                                date of the query and returning its
+                                estimated number of results, None if it is
+                                unknown and False if there are too many.
+        :param split_threshold: Queries estimated to have more results are
+                                split.
+        :param split_parts:     The number of parts for queries with too many
+                                results.
+        :param split:           Whether big queries may be split at all.
+                                Splitting makes no sense if big queries are
+                                not downloaded anyway.
+        """
+        self.tasks = []
+        self.queries = []
+        self._query_of_task = {}
+
+        for row in rows:
+            from_date, to_date = default_dates(row)
+            count = estimate(row, from_date, to_date)
+            if count is False:
+                parts = split_parts
+                cost = split_threshold * split_parts if split else 0
+            else:
+                cost = UNKNOWN_COST if count is None else count
+                parts = -(-cost // split_threshold)
+
+            if split and parts > 1:
+                ranges = split_date_range(from_date, to_date, parts)
+            else:
+                ranges = [None]
+
+            query = _Query(row['name'], range(len(self.tasks),
+                                              len(self.tasks) + len(ranges)))
+            self.queries.append(query)
+            for date_range in ranges:
+                task = Task(len(self.tasks), row, date_range,
+                            cost / len(ranges))
+                self.tasks.append(task)
+                self._query_of_task[task.id] = query
+
+        self.tasks.sort(key=lambda task: task.cost, reverse=True)
+        # (-cost, attempt, task id, task) of the tasks to hand out
+        self._queue = [(-task.cost, 0, task.id, task) for task in self.tasks]
+        heapify(self._queue)
+
+    def next_task(self):
+        """
+        :return: The (attempt, task) to run next, None if there is none
+                 left to hand out.
+        """
+        if not self._queue:
+            return None
+        _, attempt, _, task = heappop(self._queue)
+        return attempt, task
+
+    def retry(self, attempt, task):
+        """
+        Hands a failed task out again, before cheaper ones.
+
+        :param attempt: The attempt the retry is.
+        """
+        heappush(self._queue, (-task.cost, attempt, task.id, task))
+
+    @property
+    def finished(self):
+        return all(not query.pending for query in self.queries)
+
+    def complete(self, task_id, result, used=None):
+        """
+        Records the result of a task.
+
+        :param result: What the worker got, None if the task failed.
+        :param used:   The batches of the BatchStore of a part.
+        :return:       A tuple (name, result, used) if the query is done now,
+                       result is the combined result, None if the query
+                       failed. None if parts are still missing.
+        """
+        query = self._query_of_task[task_id]
+        if result is None:
+            query.failed = True
+        else:
+            query.results[task_id] = result
+            query.used |= used or set()
+        query.pending.discard(task_id)
+        if query.pending:
+            return None
+
+        if query.failed:
+            return query.name, None, None
+        results = [query.results[task_id] for task_id in sorted(query.results)]
+        if len(results) == 1:
+            return query.name, results[0], query.used
+        if all(isinstance(result, int) for result in results):
+            return query.name, sum(results), query.used
+        return query.name, [article for result in results
+                            for article in result], query.used
+
@@ -0,0 +1,106 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from time import monotonic
+
+from pyprint.ClosableObject import ClosableObject
+
+from nexis_db.PrimitiveLogPrinter import PrimitiveLogPrinter
+
+
+class SessionPool(ClosableObject):
+    """
+    Keeps authenticated Nexis sessions alive between queries so a failed
+    query costs a page reload instead of a new browser and login.
+    """
+
+    def __init__(self, create_session, printer=PrimitiveLogPrinter(),
+                 max_idle_time=300):
+        """
+        :param create_session: A callable taking user and password and
+                               returning a new, logged in Nexis object.
+        :param printer:        A PrimitiveLogPrinter for logging.
+        :param max_idle_time:  Sessions idle for longer than this many
+                               seconds are health checked before reuse.
+        """
+        ClosableObject.__init__(self)
+        self.create_session = create_session
+        self.printer = printer
+        self.max_idle_time = max_idle_time
+        # User -> list of (session, time it was released)
+        self.idle = defaultdict(list)
+        # The acquired sessions
+        self.busy = set()
+
+    def acquire(self, user, password):
+        """
+        Returns a usable session for the given account, a new one is only
+        created if no idle one is left.
+        """
+        idle = self.idle[user]
+        while idle:
+            session, released = idle.pop()
+            if (monotonic() - released < self.max_idle_time or
+                    session.recover()):
+                self.busy.add(session)
+                return session
+            session.close()
+
+        session = self.create_session(user, password)
+        self.busy.add(session)
+        return session
+
+    def release(self, session, failed=False):
+        """
+        Gives a session back to the pool.
+
+        :param session: The session acquired before.
+        :param failed:  Set to True if the last action failed. The session
+                        will be recovered and only closed if that fails.
+        :return:        False if the session had to be closed.
+        """
+        self.busy.discard(session)
+        if failed and not session.recover():
+            self.printer.warn("Session of", session.user, "is broken, "
+                              "closing it.")
+            session.close()
+            return False
+
+        self.idle[session.user].append((session, monotonic()))
+        return True
+
+    @contextmanager
+    def session(self, user, password):
+        """
+        Acquires a session for the with block and releases it afterwards,
+        marking it as failed if an exception occurred.
+        """
+        session = self.acquire(user, password)
+        try:
+            yield session
+        except BaseException:
+            self.release(session, failed=True)
+            raise
+        self.release(session)
+
+    def close_idle(self, keep=None):
+        """
+        Closes the idle sessions of all accounts but the given one.
+        """
+        for user in list(self.idle):
+            if user != keep:
+                for session, _ in self.idle.pop(user):
+                    session.close()
+
+    def abort(self):
+        """
+        Aborts the actions of the acquired sessions, may be called from
+        another thread.
+        """
+        for session in list(self.busy):
+            session.abort()
+
+    def _close(self):
+        for sessions in self.idle.values():
+            for session, _ in sessions:
+                session.close()
+        self.idle.clear()
@@ -0,0 +1,141 @@
+"""
+Runs the tasks of the Scheduler with Nexis sessions, independent of whether
+it lives in a worker process or a thread.
+"""
+from copy import copy
+
+from nexis_db.CountCache import CountCache
+from nexis_db.DedupIndex import DedupIndex
+from nexis_db.JobManifest import JobManifest
+from nexis_db.nexis import Nexis, ServerError
+from nexis_db.PrimitiveLogPrinter import PrimitiveLogPrinter
+from nexis_db.ResultSink import BatchStore, DedupSink, ListSink
+from nexis_db.Scheduler import row_dates
+from nexis_db.SessionPool import SessionPool
+
+
+class TaskRunner:
+    """
+    Holds everything one worker needs: its sessions and its own connections
+    to the SQLite files. SQLite connections can't be shared, so a TaskRunner
+    has to be created and used in one process and thread.
+    """
+
+    def __init__(self, broker, hide=True, ignore_big_queries=True,
+                 pacing=None, display_mode='private', count_cache_file=None,
+                 manifest_file=None, batch_dir=None, dedup_file=None,
+                 dedup_mode='off', login_url=None, parse_workers=0,
+                 direct_download=False, profile=None):
+        """
+        :param broker: The AccountBroker (or a proxy to it) the accounts are
+                       leased from.
+
+        See do_parallel_queries for the other parameters.
+        """
+        self.broker = broker
+        self.hide = hide
+        self.ignore_big_queries = ignore_big_queries
+        self.pacing = pacing
+        self.display_mode = display_mode
+        self.batch_dir = batch_dir
+        self.dedup_mode = dedup_mode
+        self.login_url = login_url
+        self.parse_workers = parse_workers
+        self.direct_download = direct_download
+        self.profile = profile
+        self.printer = PrimitiveLogPrinter(True)
+        self.count_cache = (CountCache(count_cache_file)
+                            if count_cache_file else None)
+        self.manifest = JobManifest(manifest_file) if manifest_file else None
+        self.dedup_index = (DedupIndex(dedup_file)
+                            if dedup_file and dedup_mode != 'off' else None)
+        self.pool = SessionPool(self._create_nexis, self.printer)
+        self.user = None
+        # The account given back after it failed, leased again only if no
+        # other one is ready
+        self.failed_user = None
+
+    def _create_nexis(self, user, password):
+        return Nexis(user=user, password=password,
+                     hide_window=self.hide, printer=self.printer,
+                     ignore_big_queries=self.ignore_big_queries,
+                     # Every session paces its own actions
+                     pacing=copy(self.pacing),
+                     display_mode=self.display_mode,
+                     count_cache=self.count_cache, login_url=self.login_url,
+                     parse_workers=self.parse_workers,
+                     direct_download=self.direct_download,
+                     profile=self.profile)
+
+    def run(self, attempt, task):
+        """
+        Runs a task.
+
+        :return: A tuple (task_id, result, used) for the Scheduler or None
+                 if the task failed and has to be retried.
+        """
+        printer, manifest = self.printer, self.manifest
+        row = task.row
+        name = row['name']
+        from_date, to_date = task.date_range or row_dates(row)
+        languages = row.get('languages', 'us')
+        if attempt > 2:
+            printer.err("Maximum attempts for task", name,
+                        "exceeded. Dropping.")
+            if manifest is not None:
+                manifest.fail(name, "Maximum attempts exceeded: " +
+                              (manifest.reason(name) or ''))
+            return task.id, None, None
+        try:
+            company_canonical_name = row['company canononical name']
+        except:
+            company_canonical_name = None
+        sink = store = None
+        if manifest is not None:
+            manifest.start(name)
+            # Parts of a split query are combined by the parent
+            sink = store = BatchStore(manifest, self.batch_dir, name,
+                                      cleanup=task.date_range is None)
+        if self.dedup_index is not None:
+            sink = DedupSink(sink or ListSink(), self.dedup_index, name,
+                             self.dedup_mode)
+        self.user, password = self.broker.lease(self.user,
+                                                avoid=self.failed_user)
+        self.failed_user = None
+        # Only the session of the leased account may stay logged in
+        self.pool.close_idle(keep=self.user)
+        logged_in = False
+        try:
+            with self.pool.session(self.user, password) as nexis:
+                logged_in = True
+                result = nexis.query(
+                    name, from_date, to_date, languages,
+                    company_canonical_name=company_canonical_name, sink=sink)
+            return task.id, result, store.used if store is not None else None
+        except Exception as exception:
+            printer.warn("Error while querying for", name,
+                         ". Restarting query later...")
+            if manifest is not None:
+                manifest.retry(name, repr(exception))
+            if not logged_in or isinstance(exception, ServerError):
+                # The account may be the cause, another one is tried next
+                self.broker.release(self.user)
+                self.failed_user, self.user = self.user, None
+            return None
+
+    def abort(self):
+        """
+        Makes a running task fail soon, may be called from another thread.
+        """
+        self.pool.abort()
+
+    def close(self):
+        self.pool.close()
+        if self.user is not None:
+            self.broker.release(self.user)
+        if self.count_cache is not None:
+            self.count_cache.close()
+        if self.manifest is not None:
+            self.manifest.close()
+        if self.dedup_index is not None:
+            self.dedup_index.close()
@@ -0,0 +1,87 @@
+"""
+Runs all Nexis sessions in one process, each in a thread of its own.
+"""
+from queue import Empty, Queue
+from threading import Event, Thread
+
+from nexis_db.AccountBroker import AccountBroker
+from nexis_db.TaskRunner import TaskRunner
+
+
+class ThreadEngine:
+    """
+    Runs every session in a thread of the parent process instead of a
+    process of its own. The sessions spend nearly all their time waiting for
+    selenium, which only offers blocking calls, so a thread per session
+    costs far less than a process and the GIL is no bottleneck.
+
+    Has the same interface as the process based engine: ``put`` hands a
+    task to the next idle session, ``get`` returns the next (attempt, task,
+    message) tuple and ``close`` stops all sessions.
+    """
+
+    def __init__(self, job_count, user_dict, account_limits, worker_options):
+        self.task_queue = Queue()
+        self.result_queue = Queue()
+        self.stopping = Event()
+        # The TaskRunners of the running sessions, to abort them on close
+        self.runners = []
+
+        broker = AccountBroker(user_dict, account_limits)
+        self.threads = [Thread(target=self._session,
+                               args=(broker, worker_options), daemon=True)
+                        for i in range(job_count)]
+        for thread in self.threads:
+            thread.start()
+
+    def _session(self, broker, worker_options):
+        try:
+            # SQLite connections stay in the thread they were opened in
+            runner = TaskRunner(broker, **worker_options)
+        except Exception as exception:
+            print('A session stopped:', repr(exception))
+            return
+        self.runners.append(runner)
+        try:
+            while not self.stopping.is_set():
+                try:
+                    attempt, task = self.task_queue.get(timeout=1)
+                except Empty:
+                    continue
+                message = runner.run(attempt, task)
+                if self.stopping.is_set():
+                    # The query was aborted, the next run resumes it
+                    break
+                # Retries go back to the Scheduler to keep its order
+                self.result_queue.put((attempt, task, message))
+        except Exception as exception:
+            # Sessions only end early if something went wrong
+            print('A session stopped:', repr(exception))
+        finally:
+            self.runners.remove(runner)
+            runner.close()
+
+    def put(self, attempt, task):
+        self.task_queue.put((attempt, task))
+
+    def get(self):
+        """
+        :return: The next result or None if all sessions are gone.
+        """
+        while True:
+            try:
+                return self.result_queue.get(timeout=10)
+            except Empty:
+                if not any(thread.is_alive() for thread in self.threads):
+                    return None
+
+    def close(self):
+        """
+        Stops all sessions, running queries are aborted instead of waiting
+        for them or the remaining tasks.
+        """
+        self.stopping.set()
+        for runner in list(self.runners):
+            runner.abort()
+        for thread in self.threads:
+            thread.join()
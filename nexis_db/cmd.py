@@ -2,18 +2,32 @@ import csv
 import sys
 sys.path.insert(0, '/home/rishus23/hacky-data-joiner/storage/models')
 from article import *
-import json
 from argparse import ArgumentParser
 from configparser import ConfigParser
 from os import makedirs, mkdir
+from datetime import timedelta
 from os.path import exists, expanduser, join
 
-from nexis_db.JSONEncoder import JSONEncoder
-from nexis_db.ParallelNexis import do_parallel_queries
+from nexis_db.AccountBroker import read_account_limits
+from nexis_db.DatabaseWriter import (DatabaseWriter, SQLiteArticleTable,
+                                     peewee_insert_batch)
+from nexis_db.DedupIndex import DEDUP_MODES
+from nexis_db.JobManifest import DONE, JobManifest
+from nexis_db.nexis import DEFAULT_SOURCE, DISPLAY_MODES, SOURCES
+from nexis_db.OutputWriter import OUTPUT_FORMATS, merge_result, write_result
+from nexis_db.PacingPolicy import PacingPolicy
+from nexis_db.ParallelNexis import ENGINES, do_parallel_queries
+from nexis_db.ResultSink import BatchStore
+from nexis_db.Scheduler import default_dates, uncovered_range
 
 CONFIGDIR = join(expanduser('~'), '.config', 'LexisNexisCrawler')
 makedirs(CONFIGDIR, exist_ok=True)
 CONFIGFILE = join(CONFIGDIR, 'users')
+COUNTCACHEFILE = join(CONFIGDIR, 'counts.sqlite')
+DEDUPINDEXFILE = join(CONFIGDIR, 'dedup.sqlite')
+# Kept in the output directory to track the progress of the queries
+MANIFEST_NAME = '.manifest.sqlite'
+BATCH_DIR_NAME = '.batches'
 
 
 def create_crawler_argparser():
@@ -26,13 +40,92 @@ def create_crawler_argparser():
                         help='Show the browser window to follow the progress.')
     parser.add_argument("-j", "--jobs", type=int,
                         help="Number of jobs to use in parallel. There will "
-                             "never be more jobs used than user data sets "
-                             "available!")
+                             "never be more jobs used than the accounts "
+                             "allow sessions (one per account unless "
+                             "configured otherwise)!")
     parser.add_argument("-l", "--limit-jobs", type=int,
                         help="Limit the number of queries to the given number.")
     parser.add_argument("-b", "--download-big-queries", action='store_true',
                         help="If set, big queries (>3000 results) will also "
                              "be downloaded.")
+    parser.add_argument("-f", "--format", choices=sorted(OUTPUT_FORMATS),
+                        default='json',
+                        help="Output format: one JSON list per query, JSON "
+                             "lines or gzip/zstd compressed JSON lines.")
+    parser.add_argument("--display", choices=DISPLAY_MODES,
+                        default='private',
+                        help="How to hide the browser windows: a virtual "
+                             "display per browser, one virtual display "
+                             "shared by all browsers or headless firefox "
+                             "without any virtual display.")
+    parser.add_argument("--engine", choices=sorted(ENGINES),
+                        default='processes',
+                        help="Run every browser session in a process of its "
+                             "own or all of them in threads of one process "
+                             "(implies --display shared instead of "
+                             "private).")
+    parser.add_argument("--login-url",
+                        help="Log in at this page instead of the Uni Hamburg "
+                             "Nexis login, e.g. a fake Nexis server.")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="Threads per session parsing downloaded batches "
+                             "while the browser downloads the next ones. By "
+                             "default every batch is parsed before the next "
+                             "download starts.")
+    parser.add_argument("--direct-download", action='store_true',
+                        help="Fetch the delivered files over HTTP with the "
+                             "cookies of the browser instead of waiting for "
+                             "the download manager of firefox. Experimental: "
+                             "the download link is only known for the fake "
+                             "server of the benchmarks, sessions not finding "
+                             "it fall back to the browser download.")
+    parser.add_argument("--load-images", action='store_true',
+                        help="Let the browsers load images, they are blocked "
+                             "by default.")
+    parser.add_argument("--allow-domain", action='append', default=[],
+                        help="A domain the browsers may load from besides "
+                             "the Nexis ones and the one of the login page. "
+                             "All others are blocked. Can be given multiple "
+                             "times.")
+    parser.add_argument("--count-cache", default=COUNTCACHEFILE,
+                        help="SQLite file caching the number of results of "
+                             "the date ranges probed when splitting big "
+                             "queries.")
+    parser.add_argument("--min-delay", type=float, default=1.0,
+                        help="Seconds to pause at least between two actions "
+                             "on the Nexis page.")
+    parser.add_argument("--jitter", type=float, default=2.0,
+                        help="Up to this many seconds are randomly added to "
+                             "every pause.")
+    parser.add_argument("--max-delay", type=float,
+                        help="Upper limit in seconds for a single pause.")
+    parser.add_argument("--actions-per-minute", type=float,
+                        help="Maximum number of paced actions per minute and "
+                             "browser session. An account allowing several "
+                             "sessions gets that many times the limit.")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default='off',
+                        help="What to do with articles already downloaded "
+                             "for another query: keep them, mark them with "
+                             "the query they were first found in or skip "
+                             "them.")
+    parser.add_argument("--dedup-index", default=DEDUPINDEXFILE,
+                        help="SQLite file remembering the articles of all "
+                             "queries for --dedup.")
+    parser.add_argument("--delta", action='store_true',
+                        help="Query finished queries again, but only for the "
+                             "dates their output does not cover yet, and add "
+                             "the new articles to it.")
+    parser.add_argument("--delta-overlap", type=int, default=1,
+                        metavar='DAYS',
+                        help="The number of days covered already that delta "
+                             "crawls query again as Nexis may have added "
+                             "articles for them since.")
+    parser.add_argument("--sqlite-db",
+                        help="Store the articles in this SQLite file instead "
+                             "of the article database.")
+    parser.add_argument("--db-batch-size", type=int, default=500,
+                        help="Number of articles stored in the database in "
+                             "one transaction.")
     return parser
 
 
@@ -43,53 +136,114 @@ def csv_rows(filename):
             yield row
 
 
-def get_new_queries(filename, output_dir, limit):
+def query_key(row):
     """
-    Reads queries from the CSV, checks wether they're already downloaded on
-    the filesystem and yields them only if they are not.
+    :return: The (name, languages, source) the coverage of a query is
+             recorded under.
+    """
+    languages = row.get('languages', 'us')
+    return row['name'], languages, SOURCES.get(languages, DEFAULT_SOURCE)
 
-    :param filename:
-    :param output_dir: The directory where the JSON files can be found.
+
+def delta_row(row, manifest, overlap=1):
     """
-    for row in csv_rows(filename):
-        if not exists(query_to_filename(output_dir, row['name'])):
-            yield row
+    :param overlap: The number of covered days to query again, see
+                    uncovered_range.
+    :return:        A copy of the CSV row asking only for the dates the output
+                    of the query does not cover yet, None if it covers all.
+    """
+    window = uncovered_range(*default_dates(row),
+                             manifest.coverage(*query_key(row)), overlap)
+    if window is None:
+        return None
+    row = dict(row)
+    row['from date'], row['to date'] = (day.strftime('%d-%m-%Y')
+                                        for day in window)
+    return row
 
-            if limit is not None:
-                limit -= 1
-                if limit == 0:
-                    break
 
+def merged_range(queried, covered):
+    """
+    :return: The dates an output covering ``covered`` covers after merging
+             the articles of ``queried`` into it, None if the output has to
+             be replaced: if ``queried`` contains ``covered`` or the ranges
+             neither overlap nor adjoin.
+    """
+    if covered is None:
+        return None
+    if queried[0] <= covered[0] and queried[1] >= covered[1]:
+        return None
+    day = timedelta(days=1)
+    if queried[0] > covered[1] + day or covered[0] > queried[1] + day:
+        return None
+    return min(queried[0], covered[0]), max(queried[1], covered[1])
 
-def query_to_filename(dir: str, search_term: str):
-    return join(dir, search_term.replace(' ', '_').replace('/', '_')+'.json')
 
+def get_new_queries(filename, output_dir, limit, manifest,
+                    extension='.json', delta=False, delta_overlap=1):
+    """
+    Reads queries from the CSV, checks in the manifest wether they're already
+    downloaded and yields them only if they are not.
 
-def write_json(filename, result):
-    with open(filename, 'w') as fileh:
-        json.dump(result, fileh, cls=JSONEncoder, indent=1)
+    :param filename:
+    :param output_dir:    The directory where the JSON files can be found.
+    :param manifest:      The JobManifest of the output directory.
+    :param extension:     The extension of the output files.
+    :param delta:         Whether to yield downloaded queries again, limited
+                          to the dates their output does not cover, see
+                          delta_row.
+    :param delta_overlap: The number of covered days delta queries ask for
+                          again.
+    """
+    for row in csv_rows(filename):
+        name = row['name']
+        state = manifest.state(name)
+        if state is None:
+            # Written before the manifest existed
+            if exists(query_to_filename(output_dir, name, extension)):
+                manifest.finish(name)
+                state = DONE
+            else:
+                manifest.add(name)
+        if delta:
+            row = delta_row(row, manifest, delta_overlap)
+            if row is None:
+                continue
+        elif state == DONE:
+            continue
+
+        yield row
 
-def update_db(result):
-    for short_article in result:
-        a = article(canonical_name=short_article['canonical_name'], company_name=short_article['company_name'],
-            author=short_article.get('author',''), section=short_article
-            .get('section',[]), headline=short_article.get('headline',''), length=getlength(
-                short_article.get('length',0)), content=short_article.get('content',''),
-            date=getdate(short_article.get('dateline','')), location=getlocation(
-                short_article.get('dateline','')))
-        a.save()
+        if limit is not None:
+            limit -= 1
+            if limit == 0:
+                break
 
-def getlength(len):
-    return int(len.split(' ')[0])
 
-def getdate(dateline):
-    return dateline
+def query_to_filename(dir: str, search_term: str, extension='.json'):
+    return join(dir, search_term.replace(' ', '_').replace('/', '_') +
+                extension)
 
-def getlocation(dateline):
-    return dateline
 
+def write_json(filename, result):
+    """
+    Writes the result into a JSON file.
+
+    :param result: Either a dict or an iterable of articles. The articles
+                   are encoded and written one at a time.
+    """
+    write_result(filename, result, 'json')
 
 
+def update_db(result, db_writer):
+    """
+    Hands the articles to the DatabaseWriter, they are stored in the
+    background. Articles marked as duplicates were stored with their first
+    query already.
+    """
+    db_writer.write_all(article for article in result
+                        if not hasattr(article, 'duplicate_of'))
+    db_writer.flush()
 
 
 def main():
@@ -103,12 +257,62 @@ def main():
     except FileExistsError:
         pass
 
+    manifest = JobManifest(join(args.OUTPUT, MANIFEST_NAME))
+    if args.sqlite_db:
+        table = SQLiteArticleTable(args.sqlite_db)
+        insert_batch = table
+    else:
+        table = None
+        insert_batch = peewee_insert_batch(article)
+    db_writer = DatabaseWriter(insert_batch, args.db_batch_size)
+    batch_dir = join(args.OUTPUT, BATCH_DIR_NAME)
+    extension = OUTPUT_FORMATS[args.format].extension
+    rows = {row['name']: row for row in get_new_queries(
+        args.QUERY_FILE, args.OUTPUT, args.limit_jobs, manifest, extension,
+        args.delta, args.delta_overlap)}
     for name, result in do_parallel_queries(
-            list(get_new_queries(args.QUERY_FILE, args.OUTPUT,
-                                 args.limit_jobs)),
+            list(rows.values()),
             args.jobs,
             user_dict,
             not args.debug,
-            ignore_big_queries=not args.download_big_queries):
-        update_db(result)
-        write_json(query_to_filename(args.OUTPUT, name), result)
+            ignore_big_queries=not args.download_big_queries,
+            pacing=PacingPolicy(args.min_delay, args.jitter, args.max_delay,
+                                args.actions_per_minute),
+            display_mode=args.display,
+            count_cache_file=args.count_cache,
+            manifest_file=join(args.OUTPUT, MANIFEST_NAME),
+            batch_dir=batch_dir,
+            dedup_file=args.dedup_index,
+            dedup_mode=args.dedup,
+            account_limits=read_account_limits(parser, user_dict),
+            engine=args.engine,
+            login_url=args.login_url, parse_workers=args.parse_workers,
+            direct_download=args.direct_download,
+            block_images=not args.load_images,
+            allow_domains=args.allow_domain):
+        store = BatchStore(manifest, batch_dir, name)
+        filename = query_to_filename(args.OUTPUT, name, extension)
+        key = query_key(rows[name])
+        queried = default_dates(rows[name])
+        covered = manifest.coverage(*key)
+        if isinstance(result, dict):
+            # The articles of earlier crawls stay
+            if covered is None:
+                write_result(filename, result, args.format)
+            manifest.finish(name)
+        else:
+            update_db(store.articles(), db_writer)
+            merged = merged_range(queried, covered) if exists(filename) \
+                else None
+            if merged is not None:
+                merge_result(filename, store.articles(), args.format)
+                queried = merged
+            else:
+                write_result(filename, store.articles(), args.format)
+            manifest.set_coverage(*key, *queried)
+            manifest.finish(name, result)
+        store.clear()
+
+    db_writer.close()
+    if table is not None:
+        table.close()
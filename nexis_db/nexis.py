@@ -1,31 +1,62 @@
 import re
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
-from datetime import date, timedelta
-from os import listdir, path, unlink
-from random import random
+from datetime import date, datetime
+from http.client import HTTPException
+from io import BytesIO
+from os import path, replace, unlink
 from shutil import rmtree
 from tempfile import mkdtemp
-from time import sleep
+from time import monotonic
+from urllib.parse import urljoin
 
 from pyprint.ClosableObject import ClosableObject
 from pyvirtualdisplay.display import Display
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import (NoSuchElementException,
+                                        WebDriverException)
 from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.support.select import Select
 
 from nexis_db.Article import Article
-from nexis_db.DirectDownloadProfile import DirectDownloadProfile
+from nexis_db.BatchSizer import BatchSizer
+from nexis_db.DeliveryClient import DeliveryClient, open_export
+from nexis_db.DirectDownloadProfile import download_preferences
+from nexis_db.DownloadWatcher import DownloadWatcher
+from nexis_db.PacingPolicy import PacingPolicy
+from nexis_db.PageWaiter import PageWaiter, any_element_located
+from nexis_db.PartitionPlanner import PartitionPlanner
 from nexis_db.PrimitiveLogPrinter import PrimitiveLogPrinter
+from nexis_db.ProfileTemplate import (EncodedProfile, allowed_domains,
+                                     build_profile)
+from nexis_db.ResultSink import ListSink
 
 
 class ServerError(Exception):
     pass
 
 
+# Cancels all downloads of the browser and removes their data, run in the
+# chrome context with execute_async_script
+_CANCEL_DOWNLOADS_SCRIPT = """
+var done = arguments[arguments.length - 1];
+Components.utils.import('resource://gre/modules/Downloads.jsm');
+Downloads.getList(Downloads.ALL).then(function (list) {
+  return list.getAll().then(function (downloads) {
+    return Promise.all(downloads.map(function (download) {
+      return download.finalize(true).then(function () {
+        return list.remove(download);
+      });
+    }));
+  });
+}).then(function () { done(null); }, function (error) { done(String(error)); });
+"""
+
+
 @contextmanager
 def open_nexis_db(user, password, hide_window=True):
     nexis = Nexis(user, password, hide_window)
@@ -39,6 +70,28 @@ class TooManyResults(Exception):
     pass
 
 
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+# Queries without a lower date limit start here
+DEFAULT_FROM_DATE = date(2005, 1, 1)
+
+# The Nexis source searched for every value of the languages column
+SOURCES = {
+    'all': 'All English and German Language News',
+    'english': 'All English Language News',
+    'german': 'German Language News',
+    'us': 'US Publications'}
+DEFAULT_SOURCE = SOURCES['us']
+
+
+# How browser windows are hidden: every browser gets its own virtual display,
+# all browsers use the display given by the DISPLAY environment variable
+# (e.g. one started by the parent process) or firefox runs headless.
+DISPLAY_MODES = ('private', 'shared', 'headless')
+
+
 class Nexis(ClosableObject):
     """
     The actual Nexis database wrapper. It fetches data from the Uni Hamburg
@@ -46,10 +99,44 @@ class Nexis(ClosableObject):
     """
 
     COUNT_REGEX = re.compile(r"([0-9]+) Dokument.* und ([0-9]+) Duplikat.*")
+    # Seconds to wait for a started download to finish
+    DOWNLOAD_TIMEOUT = 600
+    # Times the document count is read at most while Nexis analyzes
+    # duplicates, the reads are paced by the PacingPolicy
+    COUNT_SETTLE_READS = 10
+    # Seconds the search form may take to show up when checking a session
+    HEALTH_CHECK_TIMEOUT = 15
+
+    PROFISUCHE_LINK = (By.XPATH, '//a[@title="Profisuche"]')
+    SEARCH_TERMS = (By.NAME, "searchTermsTextArea")
+    TERMS_LINK = (By.CSS_SELECTOR, "a[href^='/auth/submitterms.do']")
+    RELOGIN_BUTTON = (By.XPATH, '//td/input[@title="OK"]')
+    NO_RESULTS = (By.XPATH, "//h1[@class='zeroMsgHeader']")
+    TOO_MANY_RESULTS = (By.CSS_SELECTOR, '#popupContainer span.l0')
+    DOCUMENT_COUNT = (By.XPATH, "//div/dl/dd[last()]")
+    DOWNLOAD_BUTTON = (By.ID, "delivery_DnldRender")
+    DELIVER_BUTTON = (By.CLASS_NAME, "deliverBtn")
+    DOWNLOAD_STARTED = (By.XPATH, "//*[@id='closeBtn']")
+    # The link or frame the delivered file is loaded from. Only known to
+    # match the pages of benchmarks/fake_nexis.py, without a match the
+    # browser downloads the file as usual.
+    DOWNLOAD_LINK = (By.CSS_SELECTOR,
+                     "a[href*='download'], iframe[src*='download']")
+    PARTIAL_CONTENT = (By.XPATH, "//h1[text()=\"Partial Content\"]")
+    REQUEST_ERROR = (By.XPATH, "//span[text()=\"Fehler bei der Anfrage\"]")
+    ERROR_CLOSE_LINKS = (By.XPATH, "//a/span[text()='close']")
+    AUTOCOMPLETION = (By.CSS_SELECTOR, ".ui-autocomplete li")
+
+    # Leads to the Nexis login of the Uni Hamburg
+    LOGIN_URL = ("http://rzblx10.uni-regensburg.de/dbinfo/warpto.php?bib_id="
+                 "sub_hh&color=2&titel_id=1670&url=http%3A%2F%2Femedien.sub."
+                 "uni-hamburg.de%2Fhan%2Flexis")
 
     def __init__(self, user, password, hide_window=True,
                  printer=PrimitiveLogPrinter(),
-                 ignore_big_queries=True):
+                 ignore_big_queries=True, pacing=None, wait_timeout=30,
+                 display_mode='private', count_cache=None, login_url=None,
+                 parse_workers=0, direct_download=False, profile=None):
         """
         Creates a new database proxy.
 
@@ -61,22 +148,66 @@ class Nexis(ClosableObject):
                         actions and logging.
         :param ignore_big_queries: If set to True, queries resulting in more
                                    than 3000 results will be ignored.
+        :param pacing:             The PacingPolicy deciding how long to
+                                   pause between actions.
+        :param wait_timeout:       Seconds to wait for a page to reach an
+                                   expected state.
+        :param display_mode:       One of DISPLAY_MODES, how the window is
+                                   hidden if ``hide_window`` is set.
+        :param count_cache:        A CountCache to remember the number of
+                                   results of date ranges probed when
+                                   splitting big queries.
+        :param login_url:          The page to start the login at, by default
+                                   LOGIN_URL. Point it to another server, e.g.
+                                   a fake one for benchmarks.
+        :param parse_workers:      Number of threads parsing downloaded
+                                   batches while the browser downloads the
+                                   next ones. With 0 every batch is parsed
+                                   before the next download starts.
+        :param direct_download:    Fetch the delivered files over HTTP with
+                                   the cookies of the browser instead of
+                                   waiting for the download manager of the
+                                   browser. Experimental, turned off for the
+                                   session if the delivery page has no
+                                   DOWNLOAD_LINK.
+        :param profile:            The firefox profile encoded by
+                                   build_profile, by default one is built for
+                                   this browser only.
         """
         ClosableObject.__init__(self)
 
         # If an exception occurs later those members have to exist for _close()
         self.browser = None
+        self._aborted = False
         self.display = None
         self.tempdir = None
+        self.parse_dir = None
+        self.parse_pool = None
+        self.delivery_client = None
+        self._user_agent = None
+        self.download_watcher = None
+        self.waiter = None
 
         # For (primitive) logging
         self.printer = printer
 
         self.ignore_big_queries = ignore_big_queries
+        self.pacing = pacing or PacingPolicy()
+        self.count_cache = count_cache
+        # Learns the batch size Nexis delivers reliably, kept across queries
+        self.batch_sizer = BatchSizer()
+        # Documents of the running query Nexis failed to deliver
+        self._skipped_documents = 0
+        # (search_term, from_date, to_date, languages) of the shown results
+        self._current_search = None
 
         self.user = user
         self.password = password
-        if hide_window:
+        self.login_url = login_url or self.LOGIN_URL
+        options = Options()
+        if hide_window and display_mode == 'headless':
+            options.add_argument('-headless')
+        elif hide_window and display_mode == 'private':
             with self.printer.do_safe_action(
                     'Starting virtual display',
                     "Browser window cannot be hidden. You might need to "
@@ -84,53 +215,128 @@ class Nexis(ClosableObject):
                 self.display = Display(visible=0)
                 self.display.start()
 
+        self.parse_workers = parse_workers
+        if parse_workers:
+            self.parse_pool = ThreadPoolExecutor(parse_workers)
+        self.parse_dir = mkdtemp()
+        if direct_download:
+            self.delivery_client = DeliveryClient(self.DOWNLOAD_TIMEOUT)
         self.tempdir = mkdtemp()
-        self.browser = webdriver.Firefox(DirectDownloadProfile(self.tempdir))
+        self.download_watcher = DownloadWatcher(self.tempdir)
+        options.profile = EncodedProfile(
+            profile or build_profile(allowed_domains(self.login_url)))
+        for name, value in download_preferences(self.tempdir).items():
+            options.set_preference(name, value)
+        started = monotonic()
+        self.browser = webdriver.Firefox(firefox_options=options)
+        self.printer.debug("Started firefox for {} in {:.1f} s.".format(
+            user, monotonic() - started))
+        self.waiter = PageWaiter(self.browser, wait_timeout)
 
         # Retrieve token for this session
+        self.login()
 
+    def login(self):
+        """
+        Authenticates and opens the search form, its URL is remembered as
+        ``home_url``.
+        """
         with self.printer.do_safe_action('Authenticating at Nexis',
                                          reraise=True):
             self.authenticate()
-            sleep(5)
-            self.browser.find_element_by_xpath(
-                '//a[@title="Profisuche"]').click()
-            sleep(10 + random()*5)
+            self.waiter.until('search page link', EC.element_to_be_clickable(
+                self.PROFISUCHE_LINK)).click()
+            self.waiter.until('search form', EC.presence_of_element_located(
+                self.SEARCH_TERMS))
 
         self.home_url = self.browser.current_url
 
     def authenticate(self):
-        self.browser.get(
-                "http://rzblx10.uni-regensburg.de/dbinfo/warpto.php?bib_id="
-                "sub_hh&color=2&titel_id=1670&url=http%3A%2F%2Femedien.sub."
-                "uni-hamburg.de%2Fhan%2Flexis")
-        sleep(5 + random()*5)
-
-        self.browser.find_element_by_name('User').send_keys(self.user)
+        self.browser.get(self.login_url)
+        self.waiter.until('login form', EC.presence_of_element_located(
+            (By.NAME, 'User'))).send_keys(self.user)
         self.browser.find_element_by_name('Password').send_keys(self.password)
+        self.pacing.pause()
         self.browser.find_element_by_name("submitimg").click()
 
         # accept the terms, if required
-        try:
-            sleep(10 + random()*5)
-            self.browser.find_element_by_css_selector(
-                "a[href^='/auth/submitterms.do']").click()
-        except NoSuchElementException:
-            pass
+        locator, element = self.waiter.until('login', any_element_located(
+            self.TERMS_LINK, self.RELOGIN_BUTTON, self.PROFISUCHE_LINK))
+        if locator == self.TERMS_LINK:
+            element.click()
+            locator, element = self.waiter.until(
+                'terms accepted', any_element_located(
+                    self.RELOGIN_BUTTON, self.PROFISUCHE_LINK))
 
         # Press ok on relogin prompt if needed
-        try:
-            sleep(5 + random()*5)
-            self.browser.find_element_by_xpath(
-                '//td/input[@title="OK"]').click()
+        if locator == self.RELOGIN_BUTTON:
+            element.click()
             self.printer.debug("Relogin needed for {}. Executed successfully."
                                .format(self.user))
-        except NoSuchElementException:
-            pass
-        
+
+    @property
+    def user_agent(self):
+        if self._user_agent is None:
+            self._user_agent = self.browser.execute_script(
+                'return navigator.userAgent')
+        return self._user_agent
+
+    def is_healthy(self):
+        """
+        Checks whether the search form can be reached with this session.
+        """
+        self._current_search = None
+        try:
+            self.browser.get(self.home_url)
+            return self.waiter.until(
+                'health check', EC.presence_of_element_located(
+                    self.SEARCH_TERMS),
+                timeout=self.HEALTH_CHECK_TIMEOUT, required=False) is not None
+        except WebDriverException:
+            return False
+
+    def recover(self):
+        """
+        Makes the session usable again after a failed action. The browser is
+        first sent back to the search form, only if that does not work the
+        session is assumed to be expired and the login is redone.
+
+        :return: True if the session is usable again, False if the browser
+                 has to be restarted.
+        """
+        if self._aborted:
+            return False
+        if self.is_healthy():
+            return True
+
+        self.printer.debug("Session of {} expired, logging in again."
+                           .format(self.user))
+        try:
+            self.login()
+        except Exception:
+            return False
+        return True
+
+    def abort(self):
+        """
+        Quits the browser from another thread, the running action of the
+        session fails with it. The session can't be recovered afterwards.
+        """
+        self._aborted = True
+        with self.printer.do_safe_action('Aborting the session of ' +
+                                         self.user):
+            self.browser.quit()
+
+    @property
+    def wait_timings(self):
+        """
+        A dict mapping the name of every step waited for to a list of the
+        seconds each wait took.
+        """
+        return self.waiter.timings
 
     def query(self, search_term: str, from_date: date=None, to_date: date=None,
-              languages: str='us', company_canonical_name=' '):
+              languages: str='us', company_canonical_name=' ', sink=None):
         """
         Performs a query to the NexisLexis database.
 
@@ -138,41 +344,113 @@ class Nexis(ClosableObject):
         :param from_date:   Lower date limit.
         :param to_date:     Upper date limit.
         :param languages:   One of "all", "german", "english" or "us".
+        :param sink:        The ResultSink receiving the downloaded batches,
+                            by default a ListSink.
+        :return:            The result of the sink, for the ListSink the list
+                            of articles. A dict with the error if there are
+                            too many results to be downloaded.
         """
         with self.printer.do_safe_action(
                 "Querying for '{}'".format(search_term), reraise=True):
-            if self.browser.current_url != self.home_url:
-                self.browser.get(self.home_url)
-
-            from_date = from_date or date(2005, 1, 1)
-            to_date = to_date or date.today()
+            from_date = _as_date(from_date or DEFAULT_FROM_DATE)
+            to_date = _as_date(to_date or date.today())
+            sink = sink if sink is not None else ListSink()
 
-            # Fill and submit query
-            self._fill_query_data(search_term, from_date, to_date, languages)
-            sleep(5 + random()*5)
-            self.browser.find_element_by_css_selector(
-                    "img[title='Suche']").click()
-            sleep(5 + random()*5)
+            self._search(search_term, from_date, to_date, languages)
+            self._record_count(search_term, from_date, to_date, languages)
 
             if self._no_results:
-                return []
+                return sink.result()
 
             if self.too_many_results:
                 if self.ignore_big_queries:
                     return {'error': 'Too many results (>3000)',
                             'error_code': 1}
 
-                self.printer.debug("Number of results for query '{}' exceeds "
-                                   "3000. The query will be split.".format(
-                                       search_term))
-                # Split up logarithmically
-                middle = from_date + (to_date-from_date)/2
-                one_after_middle = middle + timedelta(days=1)
-                results = self.query(search_term, from_date, middle,company_canonical_name=company_canonical_name)
-                results += self.query(search_term, one_after_middle, to_date,company_canonical_name=company_canonical_name)
-                return results
+                self._query_partitioned(
+                    search_term, from_date, to_date, languages,
+                    company_canonical_name, sink)
+            else:
+                self._get_results(company_canonical_name, search_term,
+                                  (from_date, to_date), sink)
 
-            return self._get_results(company_canonical_name, search_term)
+            return sink.result()
+
+    def _search(self, search_term, from_date, to_date, languages):
+        """
+        Fills and submits the search form, unless the browser already shows
+        the results of this very search.
+        """
+        search = (search_term, from_date, to_date, languages)
+        if search == self._current_search:
+            return
+        self._current_search = None
+
+        if self.browser.current_url != self.home_url:
+            self.browser.get(self.home_url)
+
+        # Fill and submit query
+        self._fill_query_data(search_term, from_date, to_date, languages)
+        self.pacing.pause()
+        self.browser.find_element_by_css_selector(
+                "img[title='Suche']").click()
+        self.waiter.until('search results', any_element_located(
+            self.NO_RESULTS, self.TOO_MANY_RESULTS, self.DOWNLOAD_BUTTON))
+        self._current_search = search
+
+    def _record_count(self, search_term, from_date, to_date, languages):
+        """
+        Stores the number of results of the current search in the count
+        cache, later runs use it to schedule the biggest queries first.
+        """
+        if self.count_cache is not None:
+            self.count_cache.put(
+                search_term, languages, from_date, to_date,
+                self.probe_count(search_term, from_date, to_date, languages))
+
+    def probe_count(self, search_term, from_date, to_date, languages='us'):
+        """
+        Retrieves the number of results a query would deliver.
+
+        :return: The number of documents, None if there are too many.
+        """
+        self._search(search_term, from_date, to_date, languages)
+        if self._no_results:
+            return 0
+        if self.too_many_results:
+            return None
+        return self._document_count()
+
+    def _query_partitioned(self, search_term, from_date, to_date, languages,
+                           company_canonical_name, sink):
+        """
+        Downloads the results of a query with too many results by splitting
+        its date range into parts small enough to be downloaded.
+        """
+        self.printer.debug("Number of results for query '{}' exceeds "
+                           "3000. The query will be split.".format(
+                               search_term))
+        cache = (self.count_cache.for_query(search_term, languages)
+                 if self.count_cache is not None else None)
+        planner = PartitionPlanner(
+            lambda part_from, part_to: self.probe_count(
+                search_term, part_from, part_to, languages),
+            cache)
+        # This one was just found to be too big
+        planner.cache[from_date, to_date] = None
+
+        for part_from, part_to, count in planner.plan(from_date, to_date):
+            if count == 0:
+                continue
+            if count is None:
+                self.printer.err("More than 3000 results for '{}' from {} to "
+                                 "{}, skipping them.".format(
+                                     search_term, part_from, part_to))
+                continue
+
+            self._search(search_term, part_from, part_to, languages)
+            self._get_results(company_canonical_name, search_term,
+                              (part_from, part_to), sink)
 
     def element_exists_by_xpath(self, path):
         try:
@@ -186,75 +464,213 @@ class Nexis(ClosableObject):
         return (self.element_exists_by_xpath("//h1[@class='zeroMsgHeader']")
                 is not None)
 
-    def _get_results(self, company_canonical_name, search_term):
-        def press_forward():
-            """
-            Presses the forward button so lexisnexis updates the document count.
-            """
-            try:
-                self.browser.find_element_by_xpath(
-                    '//div/ol/li[@class="last"]/a').click()
-            except:
-                pass
-
-        def get_document_count():
-            """
-            Retrieves the document count. Though it might raise over time when
-            LexisNexis decides to analyze more documents.
-            """
-            sleep(10)
-            count_text = self.browser.find_element_by_xpath(
-                "//div/dl/dd[last()]").text
-            try:
-                matches = self.COUNT_REGEX.search(count_text).groups()
-            except AttributeError:
-                # The one result case
-                return 1
-
-            documents = int(matches[0])
-            duplicates = int(matches[1])
-            return documents-duplicates
-
-        results = []
-
-        # Give nexis some time for duplication analysis
-        sleep(10)
-        press_forward()
-
-        document_count = get_document_count()
+    def _press_forward(self):
+        """
+        Presses the forward button so lexisnexis updates the document count.
+        """
+        try:
+            self.browser.find_element_by_xpath(
+                '//div/ol/li[@class="last"]/a').click()
+        except:
+            pass
+
+    def _document_count(self):
+        """
+        Retrieves the document count. Though it might raise over time when
+        LexisNexis decides to analyze more documents.
+        """
+        count_text = self.waiter.until(
+            'document count', EC.visibility_of_element_located(
+                self.DOCUMENT_COUNT)).text
+        try:
+            matches = self.COUNT_REGEX.search(count_text).groups()
+        except AttributeError:
+            # The one result case
+            return 1
+
+        documents = int(matches[0])
+        duplicates = int(matches[1])
+        return documents-duplicates
+
+    def _settled_document_count(self):
+        """
+        Reads the document count until two reads agree. Nexis removes
+        duplicates from the count on the server for a while after the
+        search, downloading starts once that is done.
+        """
+        self._press_forward()
+        document_count = self._document_count()
+        for _ in range(self.COUNT_SETTLE_READS - 1):
+            self.pacing.pause()
+            self._press_forward()
+            previous_count = document_count
+            document_count = self._document_count()
+            if document_count == previous_count:
+                break
+        return document_count
+
+    def _get_results(self, company_canonical_name, search_term, date_range,
+                     sink):
+        """
+        Downloads all results of the search shown in the browser and hands
+        them to the sink batch by batch.
+
+        :param date_range: The (from_date, to_date) of the search.
+        :param sink:       The ResultSink for the batches.
+        :return:           The number of articles.
+        """
+        # Downloading changes the page state, the search has to be redone
+        self._current_search = None
+        self.batch_sizer.start_query()
+        article_count = 0
+        self._skipped_documents = 0
+
+        document_count = self._settled_document_count()
 
         downloaded_documents = 0
-        while downloaded_documents < document_count:
-            batch_start = downloaded_documents + 1
-            batch_end = min(downloaded_documents + 200, document_count)
-            results += self._download_results(batch_start, batch_end, company_canonical_name, search_term)
-            sleep(2)
-            downloaded_documents = batch_end
-            if len(results) != downloaded_documents:
-                print("Got", len(results), "results, expecting",
-                      downloaded_documents, "instead.")
-
-            # Updates document count, lexis will do that on the server while
-            # were already downloading stuff
-            press_forward()
-            document_count = get_document_count()
-
-        return results
-
-    def _download_results(self, batch_start, batch_end, company_canonical_name, search_term, retry=3):
-        def download_in_progress():
-            # if found a file without .part extension then we're done
-            for file_ in listdir(self.tempdir):
-                if ".part" in file_:
-                    return True
+        # Batches in order whose articles are not handed to the sink yet
+        pending = deque()
+        # The count changes while Nexis analyzes duplicates, once two reads
+        # agree it is only read again when it matters: after a failed
+        # download and before finishing
+        count_settled = False
+        count_current = True
+        try:
+            while True:
+                if downloaded_documents >= document_count:
+                    if count_current:
+                        break
+                    # Make sure nothing was added while downloading
+                    self._press_forward()
+                    document_count = self._document_count()
+                    count_current = True
+                    continue
+
+                batch_start = downloaded_documents + 1
+                batch_end = sink.stored_batch_end(date_range, batch_start)
+                if batch_end is None or batch_end > document_count:
+                    batch_end = self.batch_sizer.batch_end(batch_start,
+                                                           document_count)
+                articles = sink.load(date_range, batch_start, batch_end)
+                if articles is None:
+                    source = self._download_results(batch_start, batch_end)
+                    self.pacing.pause()
+                    if source is None:
+                        if not self.batch_sizer.failed(batch_start,
+                                                       batch_end):
+                            # A single document Nexis keeps failing on
+                            # must not cost the whole query
+                            self.printer.warn(
+                                "Skipping document {} of {} for {} from {} "
+                                "to {}, Nexis failed to deliver it.".format(
+                                    batch_start, document_count,
+                                    search_term, *date_range))
+                            pending.append(
+                                (batch_start, batch_end, None, True))
+                            downloaded_documents = batch_end
+                            count_current = False
+                            continue
+                        # The range may have failed because the count
+                        # changed
+                        self._press_forward()
+                        document_count = self._document_count()
+                        count_settled = False
+                        count_current = True
+                        continue
+                    self.batch_sizer.succeeded()
+                    if self.parse_pool is None:
+                        articles = self._parse(
+                            source, company_canonical_name, search_term)
+                    else:
+                        # The browser moves on to the next batch meanwhile
+                        articles = self.parse_pool.submit(
+                            self._parse, source, company_canonical_name,
+                            search_term)
+                    pending.append((batch_start, batch_end, articles, True))
                 else:
-                    return False
-            # No files at all? Download hasn't started yet.
-            return True
+                    pending.append((batch_start, batch_end, articles, False))
+                downloaded_documents = batch_end
+                count_current = False
+                article_count = self._add_parsed(
+                    pending, date_range, sink, article_count,
+                    keep=2 * self.parse_workers)
+
+                if not count_settled:
+                    # Updates document count, lexis will do that on the
+                    # server while were already downloading stuff
+                    self._press_forward()
+                    previous_count = document_count
+                    document_count = self._document_count()
+                    count_settled = document_count == previous_count
+                    count_current = True
+        finally:
+            # Downloaded batches are kept even if the query failed
+            article_count = self._add_parsed(pending, date_range, sink,
+                                             article_count)
+
+        return article_count
+
+    def _parse(self, source, company_canonical_name, search_term):
+        """
+        Parses a downloaded batch.
+
+        :param source: The name of the downloaded file, which is removed
+                       afterwards, or a binary file object of the batch.
+        :return:       The list of articles.
+        """
+        try:
+            return list(Article.from_nexis_file(
+                source, company_canonical_name, search_term))
+        finally:
+            if isinstance(source, str):
+                unlink(source)
 
+    def _add_parsed(self, pending, date_range, sink, article_count, keep=0):
+        """
+        Hands the parsed batches at the front of ``pending`` to the sink, in
+        the order they were downloaded.
+
+        :param pending: A deque of (batch_start, batch_end, articles,
+                        downloaded) tuples, articles may be a Future or
+                        None for a skipped document.
+        :param keep:    The number of batches that may stay pending, it is
+                        waited for the parsing of the others.
+        :return:        The updated number of articles.
+        """
+        while pending:
+            batch_start, batch_end, articles, downloaded = pending[0]
+            if isinstance(articles, Future):
+                if len(pending) <= keep and not articles.done():
+                    break
+                articles = articles.result()
+            pending.popleft()
+            if articles is None:
+                sink.skip(date_range, batch_start)
+                self._skipped_documents += 1
+                continue
+            if downloaded:
+                sink.add(date_range, batch_start, batch_end, articles)
+
+            article_count += len(articles)
+            if article_count + self._skipped_documents != batch_end:
+                print("Got", article_count, "results, expecting",
+                      batch_end, "instead.")
+        return article_count
+
+    def _download_results(self, batch_start, batch_end):
+        """
+        Downloads the given range of the results.
+
+        :return: The name of the downloaded file, moved out of the download
+                 directory, a binary file object of the fetched file with
+                 ``direct_download`` or None if Nexis failed to deliver the
+                 range.
+        """
         # Open Download Popover, it'll have three "tabs" with options
-        self.browser.find_element_by_id("delivery_DnldRender").click()
-        sleep(5 + random()*5)
+        self.waiter.until('download button', EC.element_to_be_clickable(
+            self.DOWNLOAD_BUTTON)).click()
+        self.waiter.until('download popover', EC.presence_of_element_located(
+            self.DELIVER_BUTTON))
 
         # First tab: range and full text
 
@@ -281,58 +697,122 @@ class Nexis(ClosableObject):
                                            "@href='#tabs-3']").click()
         Select(self.browser.find_element_by_id("delFmt")).select_by_index(3)
 
+        # A download given up on earlier may still be written in there
+        if self.download_watcher.in_progress():
+            self._cancel_browser_downloads()
+        self.download_watcher.clear()
+
         # Actually click Download
         self.browser.find_element_by_class_name("deliverBtn").click()
 
-        while True:
-            close_btn = self.element_exists_by_xpath("//*[@id='closeBtn']")
-            if close_btn is not None:
-                # Download is started, click the OK button to close popover
-                close_btn.click()
-                break
-
-            partial_content = self.element_exists_by_xpath(
-                "//h1[text()=\"Partial Content\"]")
-            arbitrary_error = self.element_exists_by_xpath(
-                "//span[text()=\"Fehler bei der Anfrage\"]")
-            if (partial_content or arbitrary_error) is not None:
-                sleep(5)
-                for elem in self.browser.find_elements_by_xpath(
-                        "//a/span[text()='close']"):
-                    try:
-                        elem.click()
-                        break
-                    except:
-                        pass
-                else:
-                    raise RuntimeError("Closing the window impossible")
-
-                sleep(2 + random()*5)
-
-                if retry == 0:
-                    raise ServerError("Unable to fetch data.")
-
-                # Retry
-                return self._download_results(batch_start, batch_end, company_canonical_name, search_term,
-                                              retry=retry-1)
-
-            # Do not busy loop the whole time
-            sleep(1)
-
-        sleep(1)
-        while download_in_progress():
-            sleep(1)
+        locator, element = self.waiter.until(
+            'download request', any_element_located(
+                self.DOWNLOAD_STARTED, self.PARTIAL_CONTENT,
+                self.REQUEST_ERROR),
+            timeout=self.DOWNLOAD_TIMEOUT)
+        if locator != self.DOWNLOAD_STARTED:
+            self.waiter.until('error dialog', EC.presence_of_element_located(
+                self.ERROR_CLOSE_LINKS))
+            for elem in self.browser.find_elements(*self.ERROR_CLOSE_LINKS):
+                try:
+                    elem.click()
+                    break
+                except:
+                    pass
+            else:
+                raise RuntimeError("Closing the window impossible")
+            self.printer.debug("Nexis failed to deliver documents {} to {}."
+                               .format(batch_start, batch_end))
+            return None
 
-        sleep(1)
-        with open(path.join(self.tempdir, listdir(self.tempdir)[0]),
-                  'r') as file:
-            content = file.read()
-            articles = list(Article.from_nexis_text(content, company_canonical_name, search_term))
+        if self.delivery_client is not None:
+            links = self.browser.find_elements(*self.DOWNLOAD_LINK)
+            if links:
+                url = urljoin(self.browser.current_url,
+                              links[0].get_attribute('href') or
+                              links[0].get_attribute('src'))
+                source = self._fetch_delivery(url,
+                                              batch_end - batch_start + 1)
+                if source is not None:
+                    # A download the browser finished already is removed
+                    # before the next one
+                    if self.download_watcher.in_progress():
+                        self._cancel_browser_downloads()
+                    element.click()
+                    return source
+                self.printer.warn("Fetching documents {} to {} directly "
+                                  "failed, waiting for the download of the "
+                                  "browser.".format(batch_start, batch_end))
+            else:
+                self.printer.warn("The delivery page has no download link, "
+                                  "falling back to the downloads of the "
+                                  "browser for this session.")
+                self.delivery_client.close()
+                self.delivery_client = None
+
+        # Download is started, click the OK button to close popover
+        element.click()
 
-        for file in listdir(self.tempdir):
-            unlink(path.join(self.tempdir, file))
+        try:
+            download = self.download_watcher.wait(self.DOWNLOAD_TIMEOUT)
+        except TimeoutError as error:
+            raise ServerError(str(error))
+        if not download.stable:
+            raise ServerError("Download {} was still changing after {} "
+                              "seconds.".format(download.path,
+                                                self.DOWNLOAD_TIMEOUT))
+
+        # The browser may download the next batch while this one is parsed
+        filename = path.join(self.parse_dir, '{}-{}_{}'.format(
+            batch_start, batch_end, path.basename(download.path)))
+        replace(download.path, filename)
+        self.download_watcher.clear()
+
+        return filename
+
+    def _cancel_browser_downloads(self):
+        """
+        Stops all downloads of the browser, e.g. the one it started for a
+        delivery fetched directly.
+        """
+        try:
+            with self.browser.context(self.browser.CONTEXT_CHROME):
+                error = self.browser.execute_async_script(
+                    _CANCEL_DOWNLOADS_SCRIPT)
+        except WebDriverException as exception:
+            error = exception.msg
+        if error:
+            self.printer.warn("Cancelling the browser download failed: " +
+                              error)
+
+    def _fetch_delivery(self, url, document_count):
+        """
+        Fetches a delivery file with the session of the browser.
 
-        return articles
+        :param document_count: The number of documents requested.
+        :return:               A binary file object of the file or None if
+                               it could not be fetched or is not the
+                               requested export, see open_export.
+        """
+        try:
+            response = self.delivery_client.fetch(
+                url, self.browser.get_cookies(),
+                {'User-Agent': self.user_agent,
+                 'Referer': self.browser.current_url})
+            export = open_export(response, document_count)
+            if export is None:
+                self.printer.debug("Fetching {} delivered no export of {} "
+                                   "documents: status {}, {}.".format(
+                                       url, document_count, response.status,
+                                       response.getheader('Content-Type')))
+                return None
+            # The parse pool can't share the connection, it gets a copy
+            if self.parse_pool is not None:
+                return BytesIO(export.read())
+        except (OSError, HTTPException) as error:
+            self.printer.debug("Fetching {} failed: {}".format(url, error))
+            return None
+        return export
 
     @property
     def too_many_results(self):
@@ -348,29 +828,23 @@ class Nexis(ClosableObject):
         """
         Fills the search form with the given data.
         """
-        #wait = WebDriverWait(self.browser, 10)
-        #term_input = wait.until(self.browser.find_element_by_name("searchTermsTextArea"))
-        #confirm.click()
-        sleep(10)
-        term_input = self.browser.find_element_by_name("searchTermsTextArea")
+        term_input = self.waiter.until(
+            'search form', EC.element_to_be_clickable(self.SEARCH_TERMS))
         term_input.clear()
         term_input.send_keys('"' + search_term + '"')
 
-        language_value_dict = {
-            'all': 'All English and German Language News',
-            'english': 'All English Language News',
-            'german': 'German Language News',
-            'us': 'US Publications'}
-
-        source_term = language_value_dict.get(languages, 'US Publications')
+        source_term = SOURCES.get(languages, DEFAULT_SOURCE)
         self.browser.find_element_by_xpath("//div[@rel='more_sources']").click()
         # Activate JS in the text field
         self.browser.find_element_by_id('selected_source').send_keys('')
-        sleep(5 + random() * 5)
+        self.pacing.pause()
         self.browser.find_element_by_id('selected_source').send_keys(
             source_term)
         # Page needs some time to show autocompletion box
-        sleep(10 + random() * 5)
+        self.waiter.until('source autocompletion',
+                          EC.visibility_of_element_located(
+                              self.AUTOCOMPLETION),
+                          timeout=15, required=False)
         self.browser.find_element_by_id('selected_source').send_keys(
             Keys.ARROW_DOWN)
         self.browser.find_element_by_id('selected_source').send_keys(
@@ -378,7 +852,6 @@ class Nexis(ClosableObject):
 
         date_selector = self.browser.find_element_by_name("dateSelector")
 
-        '''
         # select custom date
         Select(date_selector).select_by_index(11)
         date_selector.send_keys(Keys.ENTER)
@@ -390,7 +863,6 @@ class Nexis(ClosableObject):
         to_date_field = self.browser.find_element_by_name("toDate")
         to_date_field.clear()
         to_date_field.send_keys(to_date.strftime('%d/%m/%Y'))
-        '''
 
         # Filter group duplicates
         if not self.browser.find_element_by_name("gDuplicates").is_selected():
@@ -411,10 +883,21 @@ class Nexis(ClosableObject):
                     "excludeObituariesChecked").click()
 
     def _close(self):
+        if self.waiter is not None and self.waiter.timings:
+            self.printer.debug("Wait timings for", self.user + ":\n" +
+                               self.waiter.summary())
         with self.printer.do_safe_action('Cleaning up'):
             if self.browser is not None:
                 self.browser.quit()
             if self.display is not None:
                 self.display.stop()
+            if self.download_watcher is not None:
+                self.download_watcher.close()
+            if self.parse_pool is not None:
+                self.parse_pool.shutdown()
+            if self.delivery_client is not None:
+                self.delivery_client.close()
             if self.tempdir:
                 rmtree(self.tempdir, ignore_errors=True)
+            if self.parse_dir:
+                rmtree(self.parse_dir, ignore_errors=True)
@@ -9,4 +9,5 @@ if __name__ == "__main__":
           maintainer_email='lasse.schuirmann@gmail.com',
           packages=find_packages(),
           install_requires=['PyPrint', 'PyVirtualDisplay', 'selenium'],
+          extras_require={'zstd': ['zstandard']},
           entry_points={'console_scripts': ['crawl_nexis = nexis_db.cmd:main']})
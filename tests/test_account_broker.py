@@ -0,0 +1,35 @@
+import unittest
+
+from nexis_db.AccountBroker import AccountBroker, AccountLimits
+
+
+class AccountBrokerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = AccountBroker({'alice': 'a', 'bob': 'b'})
+
+    def test_keep_account(self):
+        user, _ = self.broker.lease()
+        self.assertEqual(self.broker.lease(user)[0], user)
+
+    def test_avoid(self):
+        user, _ = self.broker.lease()
+        self.broker.release(user)
+        other, _ = self.broker.lease(avoid=user)
+        self.assertNotEqual(other, user)
+
+    def test_avoid_only_account(self):
+        broker = AccountBroker({'alice': 'a'})
+        broker.lease()
+        broker.release('alice')
+        self.assertEqual(broker.lease(avoid='alice'), ('alice', 'a'))
+
+    def test_max_sessions(self):
+        broker = AccountBroker({'alice': 'a', 'bob': 'b'},
+                               {'alice': AccountLimits(2, None, 1)})
+        users = sorted(broker.lease()[0] for _ in range(3))
+        self.assertEqual(users, ['alice', 'alice', 'bob'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from datetime import date
+
+from nexis_db.Article import (Article, parse_date, parse_header_date,
+                              parse_location, parse_word_count)
+
+HEADER = ('Copyright 2015 Prometheus Global Media, LLC\n'
+          '                              All Rights Reserved\n\n'
+          '                             hollywoodreporter.com\n\n'
+          '                            October 19, 2015 Monday\n'
+          '                                  Late Edition\n\n\n\n\n')
+
+
+class ParseDateTest(unittest.TestCase):
+
+    def test_english(self):
+        self.assertEqual(parse_date('July 16, 2013 Tuesday'),
+                         date(2013, 7, 16))
+        self.assertEqual(parse_date('Sept. 15, 2015'), date(2015, 9, 15))
+        self.assertEqual(parse_date('Dec 1 2014'), date(2014, 12, 1))
+
+    def test_english_day_first(self):
+        self.assertEqual(parse_date('16 July 2013 Tuesday'),
+                         date(2013, 7, 16))
+        self.assertEqual(parse_date('1 January 2015'), date(2015, 1, 1))
+        self.assertEqual(parse_date('Tuesday, 16 July 2013'),
+                         date(2013, 7, 16))
+        self.assertEqual(parse_date('5 Dec. 2014'), date(2014, 12, 5))
+
+    def test_german(self):
+        self.assertEqual(parse_date('3. März 2015 Dienstag'),
+                         date(2015, 3, 3))
+        self.assertEqual(parse_date('24. Dezember 2012'), date(2012, 12, 24))
+        self.assertEqual(parse_date('1. Mai 2016'), date(2016, 5, 1))
+
+    def test_numeric(self):
+        self.assertEqual(parse_date('03.04.2015'), date(2015, 4, 3))
+        self.assertEqual(parse_date('2015-04-03'), date(2015, 4, 3))
+
+    def test_first_date(self):
+        self.assertEqual(parse_date('2015-04-03, updated July 16, 2016'),
+                         date(2015, 4, 3))
+
+    def test_no_date(self):
+        self.assertIsNone(parse_date('Copyright 2015 Business Wire'))
+        self.assertIsNone(parse_date('February 30, 2015'))
+        self.assertIsNone(parse_date(''))
+
+
+class TypedFieldsTest(unittest.TestCase):
+
+    def test_word_count(self):
+        self.assertEqual(parse_word_count('875 words'), 875)
+        self.assertEqual(parse_word_count('1.234 Wörter'), 1234)
+        self.assertIsNone(parse_word_count('none'))
+
+    def test_location(self):
+        self.assertEqual(parse_location('LONDON, Sept. 15, 2015'), 'LONDON')
+        self.assertIsNone(parse_location('Sept. 15, 2015'))
+
+    def test_header_date(self):
+        self.assertEqual(parse_header_date(HEADER + 'BODY:\n\nText.'),
+                         date(2015, 10, 19))
+        self.assertEqual(parse_header_date(HEADER + 'COMPANY:\n\nACME'),
+                         date(2015, 10, 19))
+        self.assertIsNone(parse_header_date('Text without a header.'))
+
+    def test_date_priority(self):
+        content = HEADER + 'BODY:\n\nText.'
+        self.assertEqual(
+            Article(content, load_date='July 16, 2013').publication_date,
+            date(2013, 7, 16))
+        article = Article(content, dateline='BERLIN, 1 May 2014')
+        self.assertEqual(article.publication_date, date(2015, 10, 19))
+        self.assertEqual(article.location, 'BERLIN')
+        self.assertEqual(
+            Article('Text.', dateline='BERLIN, 1 May 2014').publication_date,
+            date(2014, 5, 1))
+
+    def test_from_nexis_text(self):
+        text = ('Dokument 1 von 1\n\n' + HEADER + 'BODY:\n\nSome text.\n\n'
+                'LENGTH: 2 words\n\nLOAD-DATE: October 20, 2015\n')
+        article, = Article.from_nexis_text(text, 'ACME', 'acme')
+        self.assertEqual(article.word_count, 2)
+        self.assertEqual(article.publication_date, date(2015, 10, 20))
+        self.assertEqual(article.company_name, 'acme')
+
+
+if __name__ == '__main__':
+    unittest.main()
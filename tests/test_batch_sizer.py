@@ -0,0 +1,59 @@
+import unittest
+
+from nexis_db.BatchSizer import BatchSizer
+
+
+class BatchSizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sizer = BatchSizer(initial=100, maximum=500, growth=1.5,
+                                retries=2, hold=2)
+
+    def test_grow(self):
+        self.assertEqual(self.sizer.batch_end(1, 1000), 100)
+        self.sizer.succeeded()
+        self.assertEqual(self.sizer.size, 150)
+        for _ in range(10):
+            self.sizer.succeeded()
+        self.assertEqual(self.sizer.size, 500)
+        self.assertEqual(self.sizer.batch_end(901, 1000), 1000)
+
+    def test_shrink_and_hold(self):
+        self.assertTrue(self.sizer.failed(1, 100))
+        self.assertEqual(self.sizer.size, 50)
+        # The rest of the failed range is requested at the reduced size
+        self.sizer.succeeded()
+        self.sizer.succeeded()
+        self.assertEqual(self.sizer.size, 50)
+        self.sizer.succeeded()
+        self.assertEqual(self.sizer.size, 75)
+
+    def test_start_query(self):
+        self.sizer.failed(1, 100)
+        self.sizer.failed(1, 50)
+        self.sizer.start_query()
+        self.assertEqual(self.sizer.size, 100)
+        self.sizer.succeeded()
+        self.assertEqual(self.sizer.size, 150)
+
+    def test_give_up(self):
+        self.sizer.size = 1
+        self.assertTrue(self.sizer.failed(7, 7))
+        self.assertTrue(self.sizer.failed(7, 7))
+        self.assertFalse(self.sizer.failed(7, 7))
+        # The next document gets all retries again
+        self.assertTrue(self.sizer.failed(8, 8))
+        self.assertTrue(self.sizer.failed(8, 8))
+
+    def test_success_resets_retries(self):
+        self.sizer.size = 1
+        self.assertTrue(self.sizer.failed(7, 7))
+        self.assertTrue(self.sizer.failed(7, 7))
+        self.sizer.succeeded()
+        self.assertTrue(self.sizer.failed(8, 8))
+        self.assertTrue(self.sizer.failed(8, 8))
+        self.assertFalse(self.sizer.failed(8, 8))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import sqlite3
+import unittest
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Event
+
+from nexis_db.Article import Article
+from nexis_db.DatabaseWriter import (DatabaseWriteError, DatabaseWriter,
+                                     SQLiteArticleTable, article_row)
+from nexis_db.PrimitiveLogPrinter import PrimitiveLogPrinter
+
+
+def make_article(headline, **kwargs):
+    return Article('Some text.', headline=headline,
+                   company_canonical_name='ACME', **kwargs)
+
+
+class _QuietPrinter(PrimitiveLogPrinter):
+
+    def __init__(self):
+        PrimitiveLogPrinter.__init__(self)
+        self.errors = []
+
+    def err(self, *args, **kwargs):
+        self.errors.append(args)
+
+
+class DatabaseWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.filename = join(self.directory.name, 'articles.sqlite')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def store(self, articles, batch_size=2):
+        table = SQLiteArticleTable(self.filename)
+        writer = DatabaseWriter(table, batch_size)
+        writer.write_all(articles)
+        writer.close()
+        table.close()
+
+    def rows(self):
+        connection = sqlite3.connect(self.filename)
+        try:
+            return connection.execute(
+                'SELECT headline, date FROM article ORDER BY headline'
+            ).fetchall()
+        finally:
+            connection.close()
+
+    def test_store(self):
+        self.store([make_article('A', date='July 16, 2013 Tuesday'),
+                    make_article('B'), make_article('C')])
+        self.assertEqual(self.rows(), [('A', '2013-07-16'), ('B', None),
+                                       ('C', None)])
+
+    def test_rerun_updates(self):
+        articles = [make_article('A', date='July 16, 2013'),
+                    make_article('A', date='July 17, 2013'),
+                    make_article('B'), make_article('C')]
+        self.store(articles)
+        self.store(articles, batch_size=3)
+        self.assertEqual(len(self.rows()), 4)
+
+    def test_missing_keys(self):
+        row = article_row(Article('Some text.'))
+        self.assertEqual(row['canonical_name'], '')
+        self.assertEqual(row['headline'], '')
+        self.assertIsNone(row['date'])
+
+    def test_failed_batch(self):
+        failed = Event()
+
+        def insert_batch(rows):
+            failed.set()
+            raise sqlite3.OperationalError('database is locked')
+
+        printer = _QuietPrinter()
+        writer = DatabaseWriter(insert_batch, 2, printer=printer)
+        writer.write_all([make_article('A'), make_article('B')])
+        failed.wait(10)
+        writer.batches.join()
+        with self.assertRaises(DatabaseWriteError) as context:
+            writer.write_all([make_article('C')])
+        self.assertIn('2 were not stored', str(context.exception))
+        with self.assertRaises(DatabaseWriteError):
+            writer.flush()
+        with self.assertRaises(DatabaseWriteError):
+            writer.close()
+        self.assertTrue(printer.errors)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+from nexis_db.DeliveryClient import DeliveryClient, cookie_header, open_export
+
+BODY = b'Dokument 1 von 1\n\nSome text.\n' * 1000
+EXPORT = b''.join(
+    '\ufeff\n{:>40}\n\nSome text.\n'.format(
+        'Dokument {} von 3'.format(i)).encode() for i in range(1, 4))
+ENGLISH_EXPORT = EXPORT.replace(b'Dokument 1 von 3', b'1 of 3 DOCUMENTS')
+LOGIN_PAGE = b'<html><body>Dokument 1 von 3? Please log in.</body></html>'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        if self.path == '/redirect':
+            self._respond(302, b'', Location='/file')
+        elif self.path == '/export':
+            self._respond(200, EXPORT,
+                          **{'Content-Type': 'text/plain; charset=utf-8'})
+        elif self.path == '/english':
+            self._respond(200, ENGLISH_EXPORT,
+                          **{'Content-Type': 'application/octet-stream'})
+        elif self.path == '/login':
+            self._respond(200, LOGIN_PAGE,
+                          **{'Content-Type': 'text/html; charset=utf-8'})
+        elif 'user=alice' not in self.headers.get('Cookie', ''):
+            self._respond(403, b'Forbidden')
+        else:
+            self._respond(200, BODY)
+
+    def _respond(self, status, body, **headers):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DeliveryClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.connections = set()
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.cookies = [{'name': 'user', 'value': 'alice',
+                         'domain': '127.0.0.1', 'path': '/'}]
+        self.client = DeliveryClient(timeout=10)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_cookie_header(self):
+        cookies = [{'name': 'a', 'value': '1', 'domain': '.example.com'},
+                   {'name': 'b', 'value': '2', 'domain': 'other.com'},
+                   {'name': 'c', 'value': '3', 'secure': True},
+                   {'name': 'd', 'value': '4', 'path': '/deliver'}]
+        self.assertEqual(cookie_header(cookies, 'www.example.com', '/'),
+                         'a=1')
+        self.assertEqual(
+            cookie_header(cookies, 'example.com', '/deliver/x', True),
+            'a=1; c=3; d=4')
+
+    def test_fetch_without_cookies(self):
+        response = self.client.fetch(self.url + '/file')
+        self.assertEqual(response.status, 403)
+        response.read()
+
+    def test_keep_alive(self):
+        for _ in range(3):
+            response = self.client.fetch(self.url + '/file', self.cookies)
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.read(), BODY)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_unread_body(self):
+        self.client.fetch(self.url + '/file', self.cookies).read(10)
+        response = self.client.fetch(self.url + '/file', self.cookies)
+        self.assertEqual(response.read(), BODY)
+        self.assertEqual(len(self.server.connections), 2)
+
+    def test_redirect(self):
+        response = self.client.fetch(self.url + '/redirect', self.cookies)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), BODY)
+
+    def test_export(self):
+        export = open_export(self.client.fetch(self.url + '/export'), 3)
+        self.assertEqual(export.read(), EXPORT)
+        # Read line by line like the parser does, across the checked head
+        export = open_export(self.client.fetch(self.url + '/english'), 3,
+                             head_size=100)
+        self.assertEqual(b''.join(iter(export.readline, b'')),
+                         ENGLISH_EXPORT)
+
+    def test_no_export(self):
+        # The caller falls back to the download of the browser for these
+        self.assertIsNone(open_export(
+            self.client.fetch(self.url + '/login'), 3))
+        self.assertIsNone(open_export(
+            self.client.fetch(self.url + '/export'), 2))
+        self.assertIsNone(open_export(
+            self.client.fetch(self.url + '/file'), 1))
+        # The bodies were read, the connection is still usable
+        self.assertEqual(self.client.fetch(self.url + '/export').read(),
+                         EXPORT)
+        self.assertEqual(len(self.server.connections), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import subprocess
+import sys
+import unittest
+from os import listdir
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from nexis_db.DownloadWatcher import DownloadWatcher
+
+# Writes a file like firefox does: chunks into a .part file, renamed when
+# complete
+WRITER = """
+import os, sys, time
+directory, chunks, delay = sys.argv[1], int(sys.argv[2]), float(sys.argv[3])
+part = os.path.join(directory, 'export.txt' + sys.argv[4])
+with open(part, 'wb') as file:
+    for _ in range(chunks):
+        file.write(b'x' * 1000)
+        file.flush()
+        time.sleep(delay)
+os.rename(part, os.path.join(directory, 'export.txt'))
+"""
+
+
+class DownloadWatcherTest(unittest.TestCase):
+
+    use_inotify = True
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.watcher = DownloadWatcher(self.directory.name,
+                                       stable_interval=0.2,
+                                       poll_interval=0.05,
+                                       use_inotify=self.use_inotify)
+        self.writers = []
+
+    def tearDown(self):
+        for writer in self.writers:
+            writer.kill()
+            writer.wait()
+        self.watcher.close()
+        self.directory.cleanup()
+
+    def write(self, chunks=5, delay=0.05, suffix='.part'):
+        self.writers.append(subprocess.Popen(
+            [sys.executable, '-c', WRITER, self.directory.name, str(chunks),
+             str(delay), suffix]))
+
+    def test_finished(self):
+        self.write()
+        download = self.watcher.wait(10)
+        self.assertEqual(download.path,
+                         join(self.directory.name, 'export.txt'))
+        self.assertEqual(download.size, 5000)
+        self.assertTrue(download.stable)
+
+    def test_in_progress(self):
+        self.write(chunks=100, delay=0.1)
+        with self.assertRaises(TimeoutError):
+            self.watcher.wait(0.5)
+        self.assertTrue(self.watcher.in_progress())
+
+    def test_unstable(self):
+        # Written without a .part file, still growing when the time is up
+        self.write(chunks=100, delay=0.1, suffix='')
+        download = self.watcher.wait(0.5)
+        self.assertFalse(download.stable)
+
+    def test_clear(self):
+        self.write()
+        self.watcher.wait(10)
+        self.assertFalse(self.watcher.in_progress())
+        self.watcher.clear()
+        self.assertEqual(listdir(self.directory.name), [])
+        with self.assertRaises(TimeoutError):
+            self.watcher.wait(0.3)
+
+
+class PollingDownloadWatcherTest(DownloadWatcherTest):
+
+    use_inotify = False
+
+    def test_polls(self):
+        self.assertFalse(self.watcher.uses_inotify)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from datetime import date, timedelta
+
+from nexis_db.PartitionPlanner import PartitionPlanner, split_date_range
+
+
+class CountingProbe:
+    """
+    Counts results like Nexis from the number of results per day, None for
+    more than 3000.
+    """
+
+    def __init__(self, per_day):
+        self.per_day = per_day
+        self.probes = 0
+
+    def __call__(self, from_date, to_date):
+        self.probes += 1
+        count = sum(self.per_day(from_date + timedelta(days=day))
+                    for day in range((to_date - from_date).days + 1))
+        return None if count > 3000 else count
+
+
+class PartitionPlannerTest(unittest.TestCase):
+
+    def check_cover(self, plan, from_date, to_date):
+        self.assertEqual(plan[0][0], from_date)
+        self.assertEqual(plan[-1][1], to_date)
+        for (_, end, _), (start, _, _) in zip(plan, plan[1:]):
+            self.assertEqual(start, end + timedelta(days=1))
+
+    def test_small_range(self):
+        probe = CountingProbe(lambda day: 5)
+        plan = PartitionPlanner(probe).plan(date(2016, 1, 1),
+                                            date(2016, 12, 31))
+        self.assertEqual(plan, [(date(2016, 1, 1), date(2016, 12, 31), 1830)])
+        self.assertEqual(probe.probes, 1)
+
+    def test_uniform_density(self):
+        # 16 years at 5 results a day: 29220 results, 2400 per part
+        probe = CountingProbe(lambda day: 5)
+        from_date, to_date = date(2000, 1, 1), date(2015, 12, 31)
+        plan = PartitionPlanner(probe).plan(from_date, to_date)
+
+        self.check_cover(plan, from_date, to_date)
+        self.assertTrue(all(count <= 3000 for _, _, count in plan))
+        self.assertEqual(len(plan), 13)
+        # The whole range, two too long ranges at the start and every part
+        self.assertEqual(probe.probes, 16)
+
+    def test_changing_density(self):
+        probe = CountingProbe(lambda day: 2 if day.year < 2010 else 20)
+        from_date, to_date = date(2000, 1, 1), date(2015, 12, 31)
+        plan = PartitionPlanner(probe).plan(from_date, to_date)
+
+        self.check_cover(plan, from_date, to_date)
+        self.assertTrue(all(count <= 3000 for _, _, count in plan))
+        self.assertEqual(sum(count for _, _, count in plan),
+                         2 * 3653 + 20 * 2191)
+        self.assertLessEqual(probe.probes, 2 * len(plan))
+
+    def test_cache(self):
+        cache = {}
+        from_date, to_date = date(2000, 1, 1), date(2015, 12, 31)
+        plan = PartitionPlanner(CountingProbe(lambda day: 5), cache).plan(
+            from_date, to_date)
+
+        probe = CountingProbe(lambda day: 5)
+        self.assertEqual(PartitionPlanner(probe, cache).plan(
+            from_date, to_date), plan)
+        self.assertEqual(probe.probes, 0)
+
+    def test_dense_day(self):
+        probe = CountingProbe(
+            lambda day: 5000 if day == date(2016, 1, 3) else 10)
+        plan = PartitionPlanner(probe).plan(date(2016, 1, 1),
+                                            date(2016, 1, 5))
+        self.assertIn((date(2016, 1, 3), date(2016, 1, 3), None), plan)
+        self.check_cover(plan, date(2016, 1, 1), date(2016, 1, 5))
+
+    def test_split_date_range(self):
+        self.assertEqual(
+            split_date_range(date(2016, 1, 1), date(2016, 1, 10), 3),
+            [(date(2016, 1, 1), date(2016, 1, 3)),
+             (date(2016, 1, 4), date(2016, 1, 6)),
+             (date(2016, 1, 7), date(2016, 1, 10))])
+        self.assertEqual(
+            len(split_date_range(date(2016, 1, 1), date(2016, 1, 2), 5)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
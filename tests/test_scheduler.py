@@ -0,0 +1,52 @@
+import unittest
+
+from nexis_db.Scheduler import Scheduler
+
+
+def row(name, from_date='01-01-2010', to_date='31-12-2015'):
+    return {'name': name, 'from date': from_date, 'to date': to_date}
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        counts = {'small': 100, 'medium': 1000, 'big': 2000}
+        self.scheduler = Scheduler(
+            [row(name) for name in counts],
+            lambda row, from_date, to_date: counts[row['name']])
+
+    def names(self):
+        names = []
+        for attempt, task in iter(self.scheduler.next_task, None):
+            names.append((task.row['name'], attempt))
+        return names
+
+    def test_order(self):
+        self.assertEqual(self.names(),
+                         [('big', 0), ('medium', 0), ('small', 0)])
+
+    def test_retry_keeps_order(self):
+        attempt, big = self.scheduler.next_task()
+        self.scheduler.next_task()
+        self.scheduler.retry(attempt + 1, big)
+        self.assertEqual(self.names(), [('big', 1), ('small', 0)])
+
+    def test_split(self):
+        scheduler = Scheduler([row('huge'), row('small')],
+                              lambda row, from_date, to_date:
+                              False if row['name'] == 'huge' else 10,
+                              split_parts=3)
+        tasks = [task for _, task in iter(scheduler.next_task, None)]
+        self.assertEqual([task.row['name'] for task in tasks],
+                         ['huge'] * 3 + ['small'])
+        for task in tasks[:2]:
+            self.assertIsNone(scheduler.complete(task.id, [1], set()))
+        self.assertEqual(scheduler.complete(tasks[2].id, [2], set()),
+                         ('huge', [1, 1, 2], set()))
+        self.assertFalse(scheduler.finished)
+        scheduler.complete(tasks[3].id, None)
+        self.assertTrue(scheduler.finished)
+
+
+if __name__ == '__main__':
+    unittest.main()